@@ -1,29 +1,395 @@
-from game import PHASE_LOOKUP, PLACES
-from google import genai
+from __future__ import annotations
+from game import HEARD, KILL, PHASE_LOOKUP, PLACES, SAW, Observation, phase_name
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import hashlib
 import json
 import os
-from pydantic import BaseModel, Field
-from typing import List, Optional
+import re
+import threading
+import time
+from typing import Optional, TYPE_CHECKING
+from llm_backend import TextResponse, get_backend
+from llm_service import MAX_IN_FLIGHT
+import llm_metrics
+import rate_limit
 
+if TYPE_CHECKING:
+    from ai_schemas import AIOutput, DetectiveOutput
 
-# AI output json schema
-class AIOutput(BaseModel):
-    my_plans: List[str]
-    heard: List[str]
 
+def __getattr__(name):
+    # The output schemas are imported lazily, see ai_schemas
+    if name in ("AIOutput", "DetectiveOutput", "BatchOutput"):
+        import ai_schemas
+        return getattr(ai_schemas, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-api_key = None
-with open("GEMINI_API_KEY", "r") as f:
-    api_key = f.readline().rstrip()
 
-client = genai.Client(api_key=api_key)
+def warm_up():
+    """
+    Create the LLM backend and the JSON schemas on a background thread, so the first request does not pay for them
+    """
+    def worker():
+        from ai_schemas import AIOutput, BatchOutput, DetectiveOutput, json_schema
+        json_schema(AIOutput)
+        json_schema(BatchOutput)
+        json_schema(DetectiveOutput)
+        try:
+            get_backend()
+        except OSError as error:
+            print(f"Could not create the LLM backend: {error}")
+    thread = threading.Thread(target=worker, name="ai-warm-up")
+    thread.daemon = True
+    thread.start()
+
+
+MODEL = "gemini-2.5-flash"
+
+# Response cache settings. The on-disk tier is only used when LLM_CACHE_PATH points to a SQLite file.
+CACHE_MAX_ENTRIES = 512
+CACHE_TTL = 7 * 24 * 60 * 60
+CACHE_DB_PATH = os.environ.get("LLM_CACHE_PATH")
+
+
+class LRUCache:
+    """
+    In-memory cache tier, evicts the least recently used entry when full
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class SQLiteCache:
+    """
+    On-disk cache tier, entries older than ttl seconds are ignored and removed
+    """
+
+    def __init__(self, path: str, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        import sqlite3
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
 
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute("SELECT value FROM responses WHERE key = ? AND created >= ?",
+                                  (key, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
 
+    def set(self, key: str, value: str):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, value, time.time()))
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of LLM response texts. Looks up the memory tier first and then the optional disk tier.
+    """
+
+    def __init__(self, memory: Optional[LRUCache] = None, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, system_instruction, history: list, message, config: dict) -> str:
+        # default=str makes pydantic/genai objects in the config hashable too
+        payload = json.dumps([model, system_instruction, history, message, config], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key) if self.memory else None
+        if value is None and self.disk:
+            value = self.disk.get(key)
+            if value is not None and self.memory:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        if self.memory:
+            self.memory.set(key, value)
+        if self.disk:
+            self.disk.set(key, value)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+response_cache: Optional[ResponseCache] = ResponseCache(LRUCache(), SQLiteCache(CACHE_DB_PATH) if CACHE_DB_PATH else None)
+
+
+class Chat:
+    """
+    Small replacement for client.chats that keeps the history itself, so every request can be looked up from
+    the response cache before it is sent. Per-message config is merged on top of the chat config.
+    Every request is recorded in llm_metrics under kind (or the kind passed to the message).
+    """
+
+    def __init__(self, model: str, config: dict, cache: Optional[ResponseCache] = None, kind: str = llm_metrics.CHAT):
+        self.model = model
+        self.config = config
+        self.cache = cache
+        self.kind = kind
+        self.history: list[dict] = []
+
+    def _prepare(self, message: str, config: Optional[dict]):
+        config = {**self.config, **(config or {})}
+        key = None
+        if self.cache:
+            system_instruction = config.get("system_instruction")
+            other_config = {k: v for k, v in config.items() if k != "system_instruction"}
+            key = self.cache.make_key(self.model, system_instruction, self.history, message, other_config)
+        contents = self.history + [{"role": "user", "parts": [{"text": message}]}]
+        return contents, config, key
+
+    def _record(self, message: str, text: Optional[str]):
+        # Failed/blocked responses are not added to the history, same as genai chats
+        if text:
+            self.history.append({"role": "user", "parts": [{"text": message}]})
+            self.history.append({"role": "model", "parts": [{"text": text}]})
+
+    def add_context(self, text: str, reply: str = "Understood."):
+        """
+        Add information to the history without a request, it is sent along with the next message.
+        The reply keeps the user and model turns alternating.
+        """
+        self.history.append({"role": "user", "parts": [{"text": text}]})
+        self.history.append({"role": "model", "parts": [{"text": reply}]})
+
+    def _measure(self, kind: str, message: str, contents: list, config: dict, started: float, response=None,
+                 text: Optional[str] = None, first_token: Optional[float] = None, error: Optional[Exception] = None):
+        latency = time.perf_counter() - started
+        usage = llm_metrics.response_usage(response)
+        estimated = usage is None
+        if estimated:
+            # offline backend and failed requests have no usage metadata
+            prompt = " ".join(part.get("text", "") for content in contents for part in content["parts"])
+            usage = (estimate_tokens(str(config.get("system_instruction") or "") + prompt), estimate_tokens(text or ""), 0)
+        llm_metrics.metrics.record(kind, latency, first_token, *usage, estimated=estimated,
+                                   error=None if error is None else repr(error), message=message)
+
+    def send_message(self, message: str, config: Optional[dict] = None, record: bool = True, kind: Optional[str] = None):
+        """
+        record=False leaves the message and the answer out of the history, e.g. for structured extraction
+        """
+        kind = kind or self.kind
+        started = time.perf_counter()
+        contents, config, key = self._prepare(message, config)
+        text = self.cache.get(key) if key else None
+        if text is not None:
+            response = TextResponse(text)
+            llm_metrics.metrics.record(kind, time.perf_counter() - started, cache_hit=True, message=message)
+        else:
+            try:
+                response = rate_limit.call(get_backend().generate, self.model, contents, config)
+            except Exception as error:
+                self._measure(kind, message, contents, config, started, error=error)
+                raise
+            text = response.text
+            self._measure(kind, message, contents, config, started, response, text)
+            if key and text:
+                self.cache.set(key, text)
+        if record:
+            self._record(message, text)
+        return response
+
+    def send_message_stream(self, message: str, config: Optional[dict] = None, kind: Optional[str] = None):
+        kind = kind or self.kind
+        started = time.perf_counter()
+        contents, config, key = self._prepare(message, config)
+        text = self.cache.get(key) if key else None
+        if text is not None:
+            llm_metrics.metrics.record(kind, time.perf_counter() - started, cache_hit=True, message=message)
+            yield TextResponse(text)
+        else:
+            chunks = []
+            first_token = None
+            # usage metadata comes with the last chunk
+            chunk = None
+            try:
+                for chunk in rate_limit.stream(get_backend().generate_stream, self.model, contents, config):
+                    if chunk.text:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                        chunks.append(chunk.text)
+                    yield chunk
+            except Exception as error:
+                self._measure(kind, message, contents, config, started, text="".join(chunks), first_token=first_token, error=error)
+                raise
+            text = "".join(chunks)
+            self._measure(kind, message, contents, config, started, chunk, text, first_token)
+            if key and text:
+                self.cache.set(key, text)
+        self._record(message, text)
+
+
+
+
+# Budget for what a character saw and heard in its prompt, in (estimated) tokens
+CONTEXT_TOKEN_BUDGET = 800
+# Part of the budget for what the character heard, the rest is for what it saw
+HEARD_BUDGET_SHARE = 0.4
+# Names listed in one seen observation, big crowds are shortened to a count
+MAX_NAMES_PER_OBSERVATION = 10
+
+
+def estimate_tokens(text: str) -> int:
+    # About 4 characters per token for English, close enough for budgeting without a tokenizer
+    return len(text) // 4 + 1
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\W+", " ", text).strip().lower()
+
+
+class ContextBudget:
+    """
+    Builds the seen and heard part of a character's prompt within a token budget, so prompts stop
+    growing with game length and town size. Repeated sightings are merged and the oldest heard entries are
+    replaced by a short summary when over budget. The character itself is not changed.
+    usage has the estimated tokens of the last prompt built for every character.
+    """
+
+    def __init__(self, max_tokens: int = CONTEXT_TOKEN_BUDGET, heard_share: float = HEARD_BUDGET_SHARE):
+        self.max_tokens = max_tokens
+        self.heard_share = heard_share
+        self.usage: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _render_seen(observation: Observation, last_phase: int) -> str:
+        names = list(observation.names)
+        if len(names) > MAX_NAMES_PER_OBSERVATION:
+            names = names[:MAX_NAMES_PER_OBSERVATION] + [f"{len(names) - MAX_NAMES_PER_OBSERVATION} others"]
+        when = phase_name(observation.phase)
+        if last_phase != observation.phase:
+            when = f"{when} to {phase_name(last_phase)}"
+        return f"{names} in {observation.place} at {when}"
+
+    def compact_seen(self, seen: list, budget: int) -> list[str]:
+        """
+        Render seen observations oldest first. The same people in the same place in consecutive phases
+        become one entry, duplicates are dropped and the oldest sightings are left out when over budget.
+        Kills are always kept.
+        """
+        # SAW entries as (observation, last phase it covers), everything else as (text, None)
+        merged: list[tuple] = []
+        for observation in seen:
+            if not (isinstance(observation, Observation) and observation.kind == SAW):
+                merged.append((observation, None))
+                continue
+            if merged and merged[-1][1] is not None:
+                previous, last_phase = merged[-1]
+                if previous.names == observation.names and previous.place == observation.place and observation.phase == last_phase + 1:
+                    merged[-1] = (previous, observation.phase)
+                    continue
+            merged.append((observation, observation.phase))
+
+        lines: list[tuple[str, bool]] = []
+        rendered = set()
+        for observation, last_phase in merged:
+            line = str(observation) if last_phase is None else self._render_seen(observation, last_phase)
+            if line not in rendered:
+                rendered.add(line)
+                lines.append((line, isinstance(observation, Observation) and observation.kind == KILL))
+
+        # newest sightings are kept first, kills always
+        kept = set()
+        used = 0
+        for i in reversed(range(len(lines))):
+            line, is_kill = lines[i]
+            tokens = estimate_tokens(line)
+            if is_kill or used + tokens <= budget:
+                kept.add(i)
+                used += tokens
+        result = [line for i, (line, _) in enumerate(lines) if i in kept]
+        if len(kept) < len(lines):
+            result.insert(0, f"({len(lines) - len(kept)} earlier sightings left out)")
+        return result
+
+    def compact_heard(self, heard: list, budget: int) -> list[str]:
+        """
+        Render heard entries oldest first without repeats. When over budget the oldest ones are summarized
+        as a count per speaker.
+        """
+        entries: dict[str, tuple[str, str]] = {}
+        for item in heard:
+            speaker = item.names[0] if isinstance(item, Observation) and item.kind == HEARD else ""
+            text = item.text if isinstance(item, Observation) and item.kind == HEARD else str(item)
+            key = _normalize(text)
+            # keep the latest occurrence of a repeated statement
+            entries.pop(key, None)
+            entries[key] = (speaker, str(item))
+
+        kept: list[str] = []
+        used = 0
+        older: dict[str, int] = {}
+        for speaker, line in reversed(list(entries.values())):
+            tokens = estimate_tokens(line)
+            if not older and used + tokens <= budget:
+                kept.append(line)
+                used += tokens
+            else:
+                older[speaker or "others"] = older.get(speaker or "others", 0) + 1
+        kept.reverse()
+        if older:
+            summary = ", ".join(f"{count} from {speaker}" for speaker, count in older.items())
+            kept.insert(0, f"(older things heard left out: {summary})")
+        return kept
+
+    def build(self, character, seen_start: int = 0, heard_start: int = 0) -> tuple[str, str]:
+        """
+        Returns the seen and heard text for the prompt of character, starting from the given entries
+        """
+        heard_budget = int(self.max_tokens * self.heard_share)
+        heard = self.compact_heard(character.get_heard()[heard_start:], heard_budget)
+        seen = self.compact_seen(character.get_seen()[seen_start:], self.max_tokens - sum(map(estimate_tokens, heard)))
+        seen_text, heard_text = ", ".join(seen), ", ".join(heard)
+        with self.lock:
+            self.usage[character.get_name()] = estimate_tokens(seen_text) + estimate_tokens(heard_text)
+        return seen_text, heard_text
+
+
+context_budget = ContextBudget()
 
 
 FINAL_INSTRUCTION = f"""
 The conversation has concluded.
-You must now process the *entire* conversation history (all messages from the user) and provide a single, complete JSON object.
+You must now process the conversation since the latest context update (all messages from the user after it) and provide a single, complete JSON object.
 Do not add any text before or after the JSON.
 The JSON structure must be:
 {{
@@ -34,70 +400,268 @@ Be concise and focus only on information conveyed by the user.
 """
 
 
+# Starts every message that updates a villager's knowledge, see Conversation.start_phase
+CONTEXT_UPDATE = "Context update:"
+# Answer to a context update, it is not part of the conversation
+CONTEXT_REPLY = "Understood."
+
+
 class Conversation:
+    """
+    Chat session with one villager. The system instruction only holds the persona, so it stays the same for the
+    whole game and the history is only appended to: the session can be reused in later phases (see SessionPool)
+    and Gemini's implicit prefix caching can reuse the earlier tokens of every request.
+    What changed since the last phase is added to the history as a context update by start_phase.
+    """
+
     def __init__(self, me, character, phase):
-        self.me = me
         self.character = character
-        self.phase = phase
-
-        next_places = [f"{place} at {time}" for place, time in zip(character.get_plans(), PHASE_LOOKUP[phase+1:])]
-        self.chat = client.chats.create(model="gemini-2.5-flash", config={"system_instruction": 
+        self.chat = Chat(MODEL, cache=response_cache, config={"system_instruction": 
         f"""
             You are {character.get_name()}, a simple villager living in a small town.
             Your goal is to converse naturally with the user, who is another character in the town.
             Try to keep your responses short.
             You must adopt the tone and knowledge of a friendly, small-town resident.
             The small town only has these places where you can go: {", ".join(PLACES)}
-
-            Current Knowledge:
-            It is currently {PHASE_LOOKUP[phase]}.
-            You are currently in {character.get_current_place()},
-            You are talking to {self.me.get_name()},
-            You have previously been in: {", ".join(character.get_history())},
-            You have previously seen: {", ".join(character.get_seen())},
-            You have previously heard: {", ".join(character.get_heard())},
-            You plan to go to these places next: {", ".join(next_places)} (you may only move during those times),
+            Messages starting with "{CONTEXT_UPDATE}" are not said by the user, they tell you the current time,
+            where you are, who you are talking to and what you have seen and heard since the previous update.
             Your plan is flexible, you can deviate from it if someone asks you to.
         """
         })
+        # How much of the character's history, seen and heard the session already knows
+        self._known_history = 0
+        self._known_seen = 0
+        self._known_heard = 0
+        self.me = None
+        self.phase = None
+        self.start_phase(me, phase)
+
+    def start_phase(self, me, phase):
+        """
+        Tell the session the current time, place and partner and what the character saw and heard since
+        the previous update. Nothing is sent before the next message.
+        """
+        character = self.character
+        first = self._known_history == 0
+        self.me = me
+        self.phase = phase
 
-    def send_message(self, user_input):
-        return self.chat.send_message(user_input)
+        next_places = [f"{place} at {time}" for place, time in zip(character.get_plans(), PHASE_LOOKUP[phase+1:])]
+        seen, heard = context_budget.build(character, self._known_seen, self._known_heard)
+        known = "You have previously" if first else "Since the previous update you have"
+        self.chat.add_context(f"""{CONTEXT_UPDATE}
+            It is currently {PHASE_LOOKUP[min(phase, len(PHASE_LOOKUP)-1)]}.
+            You are currently in {character.get_current_place()},
+            You are talking to {me.get_name()},
+            {known} been in: {", ".join(character.get_history()[self._known_history:])},
+            {known} seen: {seen},
+            {known} heard: {heard},
+            You plan to go to these places next: {", ".join(next_places)} (you may only move during those times)
+        """)
+        self._known_history = len(character.get_history())
+        self._known_seen = len(character.get_seen())
+        self._known_heard = len(character.get_heard())
+        self._phase_start = len(self.chat.history)
+
+    def sync(self):
+        """
+        Tell the session what the character saw or heard since the last update within the same phase,
+        e.g. a kill it witnessed after the session was prepared. The conversation of the phase goes on.
+        """
+        character = self.character
+        if len(character.get_seen()) == self._known_seen and len(character.get_heard()) == self._known_heard:
+            return
+        seen, heard = context_budget.build(character, self._known_seen, self._known_heard)
+        self.chat.add_context(f"""{CONTEXT_UPDATE}
+            Just now you have seen: {seen},
+            Just now you have heard: {heard}
+        """, CONTEXT_REPLY)
+        self._known_seen = len(character.get_seen())
+        self._known_heard = len(character.get_heard())
+
+    def transcript(self) -> list[tuple[str, str]]:
+        """
+        (speaker, text) of every message since the last context update, greetings included
+        """
+        lines = []
+        history = self.chat.history[self._phase_start:]
+        for message, answer in zip(history[::2], history[1::2]):
+            if not message["parts"][0]["text"].startswith(CONTEXT_UPDATE):
+                lines.append((self.me.get_name(), message["parts"][0]["text"]))
+            elif answer["parts"][0]["text"] == CONTEXT_REPLY:
+                continue
+            lines.append((self.character.get_name(), answer["parts"][0]["text"]))
+        return lines
+
+    def send_message(self, user_input, kind: str = llm_metrics.CHAT):
+        return self.chat.send_message(user_input, kind=kind)
+
+    def prefetch_opener(self):
+        """
+        Generate a greeting to the partner without adding it to the history, so it can be thrown away.
+        See commit_opener.
+        """
+        return self.chat.send_message(self._opener_instruction(), record=False, kind=llm_metrics.PRIMING)
+
+    def commit_opener(self, text: str):
+        """
+        Add a greeting made by prefetch_opener to the history, once it was shown
+        """
+        self.chat.add_context(self._opener_instruction(), text)
+
+    def _opener_instruction(self) -> str:
+        return f"{CONTEXT_UPDATE} {self.me.get_name()} has just walked up to you. Greet them in one short sentence."
+
+    def send_message_stream(self, user_input):
+        """
+        Same as send_message but yields the answer text in chunks as Gemini generates it
+        """
+        for chunk in self.chat.send_message_stream(user_input):
+            if chunk.text:
+                yield chunk.text
 
     
     def end_conversation(self):
+        self.apply_final_output(self.get_final_output())
+
+    def get_final_output(self) -> Optional[AIOutput]:
+        """
+        Ask the model for the structured summary of this conversation. Only does the network round-trip,
+        the character is not touched so this can be run from a worker thread.
+        """
+        from ai_schemas import AIOutput, json_schema
+        from pydantic import ValidationError
+
+        # The instruction and the JSON are not part of the conversation, later phases continue without them
         final_response = self.chat.send_message(FINAL_INSTRUCTION, config={
             "response_mime_type": "application/json",
-            "response_json_schema": AIOutput.model_json_schema(),
-        })
+            "response_json_schema": json_schema(AIOutput),
+        }, record=False, kind=llm_metrics.FINALIZE)
 
         try:
-            # The AI is instructed to output only JSON, so we try to parse it
-            formatted_output = AIOutput.model_validate_json(final_response.text.strip())
-
-            for i in range(len(formatted_output.my_plans)):
-                new_plan = formatted_output.my_plans[i]
-                if i < len(self.character.plan):
-                    self.character.plan[i] = formatted_output.my_plans[i]
-                else:
-                    self.character.plan.append(new_plan)
-                
-
-            for new in formatted_output.heard:
-                self.character.add_heard(f"{self.me.get_name()} said: {new}")
-            
-
-
-        except json.JSONDecodeError:
+            # The AI is instructed to output only JSON, so we try to parse it. Blocked responses have no text.
+            return AIOutput.model_validate_json((final_response.text or "").strip())
+        except (json.JSONDecodeError, ValidationError):
             print("Error: Could not parse the structured output as JSON.")
             print("Raw response:")
             print(final_response.text)
+            return None
+
+    def apply_final_output(self, formatted_output: Optional[AIOutput]):
+        """
+        Write the plans and heard information from the summary into the character
+        """
+        if formatted_output is None:
+            return
+
+        for i in range(len(formatted_output.my_plans)):
+            new_plan = formatted_output.my_plans[i]
+            if i < len(self.character.plan):
+                self.character.plan[i] = formatted_output.my_plans[i]
+            else:
+                self.character.plan.append(new_plan)
+
+        known = {_normalize(heard.text if isinstance(heard, Observation) else str(heard)) for heard in self.character.get_heard()}
+        for new in formatted_output.heard:
+            # the model often repeats what was already heard in earlier conversations
+            if _normalize(new) in known:
+                continue
+            known.add(_normalize(new))
+            self.character.add_heard(Observation(HEARD, (self.me.get_name(),), self.character.get_current_place(), self.phase, new))
+        # the session was there when these were said, the next context update does not need to repeat them
+        self._known_heard = len(self.character.get_heard())
+
+
+class SessionPool:
+    """
+    One long-lived Conversation per villager, reused in every phase and in the detective phase
+    instead of starting a new chat (and sending the whole prompt again) each time
+    """
+
+    def __init__(self):
+        self.sessions: dict[str, Conversation] = {}
+        self.lock = threading.Lock()
+
+    def get(self, me, character, phase) -> Conversation:
+        """
+        Session with character, updated to phase and the partner me and to what the character saw and heard
+        """
+        with self.lock:
+            session = self.sessions.get(character.get_name())
+            if session is None:
+                session = Conversation(me, character, phase)
+                self.sessions[character.get_name()] = session
+            elif session.phase != phase or session.me is not me:
+                session.start_phase(me, phase)
+            else:
+                session.sync()
+            return session
+
+
+BATCH_FINAL_INSTRUCTION = f"""
+The conversations below have concluded.
+For every conversation return one entry in "villagers", processing all messages the villager got from the other character.
+Do not add any text before or after the JSON.
+Every entry must be:
+{{
+    "name": "The name of the villager",
+    "my_plans": ["A list of places the villager is planning to go to, the other character might've affected this. The allowed places are: {', '.join(PLACES)}"],
+    "heard": ["A list of important pieces of information or dialogue the other character shared that the villager heard."]
+}}
+Be concise and focus only on information conveyed to the villagers.
+"""
 
 
-# Detective output json schema
-class DetectiveOutput(BaseModel):
-    suspect: str
-    explanation: str
+def extract_all(conversations: list[Conversation]) -> list[Optional[AIOutput]]:
+    """
+    Same as calling get_final_output of every conversation, but with one request for all of them.
+    Conversations missing from the answer, or all of them if it is empty or does not validate, fall back to
+    their own requests, sent at the same time. A failed fallback gives None.
+    Does not touch the characters, so it can run on a worker thread.
+    """
+    from ai_schemas import AIOutput, BatchOutput, json_schema
+    from pydantic import ValidationError
+
+    sections = []
+    for conversation in conversations:
+        character = conversation.character
+        plans = ", ".join(f"{place} at {time}" for place, time in zip(character.get_plans(), PHASE_LOOKUP[conversation.phase+1:]))
+        lines = "\n".join(f"{speaker}: {text}" for speaker, text in conversation.transcript())
+        sections.append(f"Conversation with {character.get_name()} (current plan: {plans}):\n{lines}")
+
+    outputs: dict[str, AIOutput] = {}
+    response = Chat(MODEL, cache=response_cache, config={}, kind=llm_metrics.FINALIZE).send_message(
+        BATCH_FINAL_INSTRUCTION + "\n\n" + "\n\n".join(sections), config={
+            "response_mime_type": "application/json",
+            "response_json_schema": json_schema(BatchOutput),
+        })
+    try:
+        if not response.text:
+            # blocked or empty response
+            raise ValueError("no text in the response")
+        for villager in BatchOutput.model_validate_json(response.text.strip()).villagers:
+            outputs[villager.name] = AIOutput(my_plans=villager.my_plans, heard=villager.heard)
+    except (json.JSONDecodeError, ValidationError, ValueError) as error:
+        print(f"Batched extraction failed, extracting one by one: {error}")
+
+    missing = [conversation for conversation in conversations if conversation.character.get_name() not in outputs]
+    if missing:
+        # every thread gets a copy of this context, so the fallbacks keep the request priority and cancellation.
+        # The fallbacks run inside one LLMService request, so they get no more requests in flight than the service.
+        with ThreadPoolExecutor(max_workers=min(len(missing), MAX_IN_FLIGHT), thread_name_prefix="extract") as pool:
+            futures = {conversation.character.get_name(): pool.submit(contextvars.copy_context().run, conversation.get_final_output)
+                       for conversation in missing}
+        for name, future in futures.items():
+            try:
+                outputs[name] = future.result()
+            except rate_limit.RequestCancelled:
+                raise
+            except Exception as error:
+                print(f"Extraction for {name} failed: {error!r}")
+                outputs[name] = None
+
+    return [outputs.get(conversation.character.get_name()) for conversation in conversations]
+
 
 DETECTIVE_FINAL_INSTRUCTION = """
     The interrogation has concluded.
@@ -119,7 +683,7 @@ class DetectiveConversation:
         self.victim = victim
 
         self.question_limit = MAX_QUESTIONS
-        self.chat = client.chats.create(model="gemini-2.5-flash", config={"system_instruction": 
+        self.chat = Chat(MODEL, cache=response_cache, config={"system_instruction": 
         f"""
             You are a detective solving a murder mystery in a small town.
             A villager has been murdered and you must solve who did it!
@@ -130,7 +694,7 @@ class DetectiveConversation:
             You will interrogate each town member seperately.
             Ask around {self.question_limit} questions in total for each person and end the conversation by saying "ok, i am done here" when you feel like you have gotten everything out of the person or the person wants to stop.
             """
-        })
+        }, kind=llm_metrics.DETECTIVE)
 
     def change_character(self, character):
         self.question_limit = MAX_QUESTIONS
@@ -141,25 +705,43 @@ class DetectiveConversation:
         self.question_limit -= 1
         return self.chat.send_message(user_input)
 
+    def review_interrogations(self, transcripts: dict[str, list[tuple[str, str]]]):
+        """
+        Give the detective the notes of interrogations that were run by other DetectiveConversations
+        (one per suspect, so they can run at the same time). transcripts maps suspect name to (speaker, text) lines.
+        """
+        notes = "\n\n".join(
+            f"Interrogation of {name}:\n" + "\n".join(f"{speaker}: {text}" for speaker, text in lines)
+            for name, lines in transcripts.items()
+        )
+        return self.chat.send_message(f"You have now interrogated everyone. These are your notes:\n\n{notes}")
+
     
-    def end_conversation(self):
+    def end_conversation(self) -> Optional[DetectiveOutput]:
+        """
+        The detective's verdict, None if the answer could not be parsed
+        """
+        from ai_schemas import DetectiveOutput, json_schema
+        from pydantic import ValidationError
+
         final_response = self.chat.send_message(DETECTIVE_FINAL_INSTRUCTION, config={
             "response_mime_type": "application/json",
-            "response_json_schema": DetectiveOutput.model_json_schema(),
-        })
+            "response_json_schema": json_schema(DetectiveOutput),
+        }, kind=llm_metrics.FINALIZE)
 
         try:
             # The AI is instructed to output only JSON, so we try to parse it
-            formatted_output = DetectiveOutput.model_validate_json(final_response.text.strip())
+            formatted_output = DetectiveOutput.model_validate_json((final_response.text or "").strip())
 
             return formatted_output
             
 
 
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, ValidationError):
             print("Error: Could not parse the structured output as JSON.")
             print("Raw response:")
             print(final_response.text)
+            return None
 
 
 
@@ -0,0 +1,35 @@
+from functools import cache
+from pydantic import BaseModel
+from typing import List
+
+# pydantic is slow to import, so these schemas live in their own module that ai.py only imports on first use
+
+
+# AI output json schema
+class AIOutput(BaseModel):
+    my_plans: List[str]
+    heard: List[str]
+
+
+# One villager's part of a batched extraction
+class VillagerOutput(AIOutput):
+    name: str
+
+
+# Batched extraction json schema, one entry per conversation
+class BatchOutput(BaseModel):
+    villagers: List[VillagerOutput]
+
+
+# Detective output json schema
+class DetectiveOutput(BaseModel):
+    suspect: str
+    explanation: str
+
+
+@cache
+def json_schema(model: type[BaseModel]) -> dict:
+    """
+    JSON schema of model, generated only once
+    """
+    return model.model_json_schema()
@@ -0,0 +1,247 @@
+"""
+Benchmarks of the game model, UI drawing and the LLM plumbing, compared against a stored baseline.
+The UI runs on the dummy SDL video driver and the LLM is the offline backend with a fixed latency,
+so no window, network or API key is needed.
+
+    python bench.py                      # run everything and compare with bench_baseline.json
+    python bench.py --filter textarea    # only benchmarks with this in their name
+    python bench.py --update-baseline    # store the results as the new baseline
+"""
+import os
+# Must be set before pygame and the LLM modules are imported
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ["LLM_BACKEND"] = "offline"
+os.environ["LLM_OFFLINE_LATENCY"] = os.environ.get("BENCH_LLM_LATENCY", "0.05")
+os.environ["LLM_OFFLINE_JITTER"] = "0"
+os.environ.pop("LLM_CACHE_PATH", None)
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from functools import partial
+import pygame
+from game import Game, STATES
+from simulation import make_names, make_places
+
+BASELINE_PATH = "bench_baseline.json"
+# Seconds per repeat (setup included) and repeats per benchmark, the median repeat is reported
+MIN_TIME = 0.2
+REPEATS = 5
+# Slower than the baseline by more than this factor is a regression
+TOLERANCE = 1.3
+TOWN_SIZES = [10, 100, 1000]
+# Places grow with the town, so rooms do not get crowded faster than in the real game
+VILLAGERS_PER_PLACE = 3
+# Lookups per place in one people_in_room operation, a single one is too short to time
+LOOKUPS = 100
+
+SHORT_ANSWER = "Oh, hello there! Lovely weather today, isn't it?"
+LONG_ANSWER = " ".join([
+    "Well, I was at the Tavern this morning, then I walked over to the Field because Bob said the harvest",
+    "needed extra hands. On the way I saw Alice near the Forest talking to someone I did not recognize.",
+] * 20)
+# Every revealed letter redraws the whole bubble, so the reveal is measured on a long answer of usual length
+REVEAL_ANSWER = LONG_ANSWER[:1000]
+
+_screen: pygame.Surface | None = None
+
+
+def screen() -> pygame.Surface:
+    global _screen
+    if _screen is None:
+        pygame.init()
+        _screen = pygame.display.set_mode((1280, 720))
+    return _screen
+
+
+def make_game(villagers: int, seed: int = 0) -> Game:
+    return Game(make_names(villagers), make_places(max(1, villagers // VILLAGERS_PER_PLACE)), STATES, random.Random(seed))
+
+
+# Every benchmark does one operation and returns the seconds it took, setup excluded
+
+def bench_game_advance(villagers: int) -> float:
+    """
+    One Game.advance of a town with this many villagers, averaged over a whole game
+    """
+    game = make_game(villagers)
+    player = game.get_player()
+    started = time.perf_counter()
+    for _ in range(STATES):
+        game.advance(player.get_current_place())
+    return (time.perf_counter() - started) / STATES
+
+
+def bench_people_in_room(villagers: int) -> float:
+    """
+    One Game.people_in_room, averaged over every place
+    """
+    game = make_game(villagers)
+    started = time.perf_counter()
+    for _ in range(LOOKUPS):
+        for place in game.places:
+            game.people_in_room(place)
+    return (time.perf_counter() - started) / (LOOKUPS * len(game.places))
+
+
+def bench_textarea_draw(text: str, cached: bool) -> float:
+    """
+    TextArea.draw of an answer, with the layout (wrapping and rendering) done first unless cached
+    """
+    from ui_textarea import TextArea
+    surface = screen()
+    text_area = TextArea((300, 200), (680, 350), text)
+    if cached:
+        text_area.draw(surface)
+    started = time.perf_counter()
+    text_area.draw(surface)
+    return time.perf_counter() - started
+
+
+def bench_speech_reveal(text: str) -> float:
+    """
+    Revealing a whole answer letter by letter in a SpeechBubble and drawing every step, without the delays
+    """
+    from ui_speech import SpeechBubble
+    surface = screen()
+    with redirect_stdout(None):
+        bubble = SpeechBubble("Alice", text)
+    started = time.perf_counter()
+    while not bubble.all_written:
+        bubble.reveal_letter(started)
+        bubble.draw(surface)
+    return time.perf_counter() - started
+
+
+def bench_advance_turn(conversations: int) -> float:
+    """
+    From pressing "Advance turn" with this many finished conversations until the next phase,
+    through the LLMService and the offline backend
+    """
+    import ai
+    import main
+    # the response cache would answer repeated runs without the backend
+    ai.response_cache = None
+    random.seed(0)
+    with redirect_stdout(None):
+        window = main.GameWindow(screen())
+        player = window.game.get_player()
+        for character in [c for c in window.game.get_characters().values() if c is not player][:conversations]:
+            conversation = window.sessions.get(player, character, window.game.game_phase)
+            conversation.chat.add_context("Let's meet at the Field later.", "Sure, see you there!")
+            window.conversations[character.get_name()] = conversation
+
+        started = time.perf_counter()
+        window.advance_turn(player.get_current_place())
+        while window.is_waiting:
+            window.llm.process_results()
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        window.close()
+    return elapsed
+
+
+BENCHMARKS = {
+    **{f"game_advance[{size}]": partial(bench_game_advance, size) for size in TOWN_SIZES},
+    **{f"people_in_room[{size}]": partial(bench_people_in_room, size) for size in TOWN_SIZES},
+    "textarea_draw[short]": partial(bench_textarea_draw, SHORT_ANSWER, False),
+    "textarea_draw[long]": partial(bench_textarea_draw, LONG_ANSWER, False),
+    "textarea_draw[long,cached]": partial(bench_textarea_draw, LONG_ANSWER, True),
+    "speech_reveal[short]": partial(bench_speech_reveal, SHORT_ANSWER),
+    "speech_reveal[long]": partial(bench_speech_reveal, REVEAL_ANSWER),
+    "advance_turn[1]": partial(bench_advance_turn, 1),
+    "advance_turn[3]": partial(bench_advance_turn, 3),
+}
+
+
+def measure(benchmark, min_time: float = MIN_TIME, repeats: int = REPEATS) -> dict:
+    """
+    Run benchmark for min_time seconds, repeats times. Times are seconds per operation, without the setup.
+    """
+    benchmark()  # warm up caches and lazy imports
+    times = []
+    operations = 0
+    for _ in range(repeats):
+        total, count = 0.0, 0
+        deadline = time.perf_counter() + min_time
+        while count == 0 or time.perf_counter() < deadline:
+            total += benchmark()
+            count += 1
+        times.append(total / count)
+        operations += count
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "operations": operations}
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict]) -> dict[str, float]:
+    """
+    Ratio of the median to the baseline median for every benchmark in both
+    """
+    return {name: result["median"] / baseline[name]["median"]
+            for name, result in results.items() if name in baseline and baseline[name]["median"] > 0}
+
+
+def format_time(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def machine() -> dict:
+    return {"python": platform.python_version(), "pygame": pygame.version.ver,
+            "platform": platform.platform(), "processor": platform.processor() or platform.machine()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmarks and compare them with the baseline")
+    parser.add_argument("--filter", default="", help="only run benchmarks with this in their name")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store the results in the baseline file")
+    parser.add_argument("--output", metavar="PATH", help="also write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="slowdown factor that counts as a regression")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds per repeat")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["benchmarks"]
+
+    results = {}
+    for name, benchmark in BENCHMARKS.items():
+        if args.filter in name:
+            results[name] = measure(benchmark, args.min_time)
+            ratio = compare({name: results[name]}, baseline).get(name)
+            change = "" if ratio is None else f"{ratio:6.2f}x baseline"
+            flag = " REGRESSION" if ratio is not None and ratio > args.tolerance else ""
+            print(f"{name:28} {format_time(results[name]['median']):>10}  {change}{flag}")
+
+    report = {"machine": machine(), "benchmarks": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.update_baseline:
+        # benchmarks that were not run keep their baseline
+        report["benchmarks"] = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = [name for name, ratio in compare(results, baseline).items() if ratio > args.tolerance]
+    if not baseline:
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create it")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) over {args.tolerance}x: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
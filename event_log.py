@@ -0,0 +1,126 @@
+"""
+Append-only JSONL log of game sessions: moves, kills, observations, LLM messages and plan rewrites,
+with a snapshot of the whole game after every SNAPSHOT_INTERVAL phases.
+A session can be restored at any phase from the log without calling the LLM again:
+
+    python main.py --event-log session.jsonl
+    python main.py --replay session.jsonl --replay-phase 3
+"""
+import json
+import threading
+import time
+from game import SAW, Game, Observation
+
+# Phases between full snapshots, replay starts from the last snapshot before the wanted phase
+SNAPSHOT_INTERVAL = 1
+
+
+class EventLog:
+    """
+    Writes one JSON object per line. Every event has a type, the session number, the game phase and a timestamp.
+    With path None nothing is written, so callers do not need to check if logging is on.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        self._lock = threading.Lock()
+        self.session = 0
+
+    def log(self, event_type: str, game: Game, **fields):
+        if self._file is None:
+            return
+        event = {"type": event_type, "session": self.session, "phase": game.game_phase, "time": time.time(), **fields}
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            # one write per line and flushed right away, so a crash loses at most the event being written
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def start(self, game: Game):
+        """
+        Start a new session, e.g. when a new GameWindow is opened
+        """
+        self.session = int(time.time() * 1000)
+        self.log("start", game, snapshot=game.snapshot())
+
+    def advance(self, game: Game, player_move: str):
+        """
+        Log a finished Game.advance: where everyone is now and what they saw in the phase that ended
+        """
+        seen: dict[int, Observation] = {}
+        for c in game.characters.values():
+            # advance adds one shared SAW record per place, log each once
+            if c.seen and c.seen[-1].kind == SAW and c.seen[-1].phase == game.game_phase - 1:
+                seen[id(c.seen[-1])] = c.seen[-1]
+        self.log("advance", game, player_move=player_move,
+                 places={c.get_name(): c.get_current_place() for c in game.characters.values()},
+                 observations=[observation.as_dict() for observation in seen.values()])
+        if game.game_phase % SNAPSHOT_INTERVAL == 0:
+            self.log("snapshot", game, snapshot=game.snapshot())
+
+    def kill(self, game: Game, victim: str):
+        place = game.characters[victim].get_current_place()
+        self.log("kill", game, victim=victim, place=place,
+                 witnesses=[c.get_name() for c in game.people_in_room(place) if c.is_alive() and c.get_name() != victim])
+
+    def plan(self, game: Game, character: str, old_plan: list[str], heard: list[Observation]):
+        """
+        Log the result of Conversation.apply_final_output: the new plan and what the character heard
+        """
+        new_plan = list(game.characters[character].get_plans())
+        self.log("plan", game, character=character, old_plan=old_plan, plan=new_plan,
+                 heard=[observation.as_dict() for observation in heard])
+
+    def llm(self, game: Game, character: str, message: str, response: str, latency: float, first_chunk: float | None = None,
+            error: str | None = None):
+        """
+        Log an LLM answer. When the request failed, response is the part that arrived before the error.
+        """
+        self.log("llm", game, character=character, message=message, response=response,
+                 latency=latency, first_chunk=first_chunk, error=error)
+
+
+def read_sessions(path: str) -> list[list[dict]]:
+    """
+    All events of the log grouped by session, in the order they were written
+    """
+    sessions: dict[int, list[dict]] = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                event = json.loads(line)
+                sessions.setdefault(event["session"], []).append(event)
+    return list(sessions.values())
+
+
+def replay(path: str, phase: int | None = None, session: int = -1) -> Game:
+    """
+    Restore a session (the last one by default) as it was at the end of phase, or at the end of the log.
+    Starts from the last snapshot before phase and applies the kills, plan rewrites and moves after it.
+    """
+    events = read_sessions(path)[session]
+    start = 0
+    for i, event in enumerate(events):
+        if event["type"] in ("start", "snapshot") and (phase is None or event["snapshot"]["game_phase"] <= phase):
+            start = i
+    if events[start]["type"] not in ("start", "snapshot"):
+        raise ValueError(f"No snapshot in session {session} of {path}")
+
+    game = Game.from_snapshot(events[start]["snapshot"])
+    for event in events[start + 1:]:
+        if event["type"] == "kill":
+            game.kill_character(game.characters[event["victim"]])
+        elif event["type"] == "plan":
+            character = game.characters[event["character"]]
+            character.plan[:] = event["plan"]
+            for heard in event["heard"]:
+                character.add_heard(Observation.from_dict(heard))
+        elif event["type"] == "advance":
+            if phase is not None and game.game_phase >= phase:
+                break
+            game.advance(event["player_move"])
+            places = {c.get_name(): c.get_current_place() for c in game.characters.values()}
+            if places != event["places"]:
+                raise ValueError(f"Replay of {path} diverged from the log at phase {game.game_phase}")
+    return game
@@ -0,0 +1,130 @@
+"""
+Optional per-frame timing of the main loop and of every component drawn by the DirtyRenderer.
+Sections nest, the time of a section is recorded under its stack ("frame;draw;flush;room Field").
+Keeps rolling percentiles for the overlay (F4) and writes the self time of every stack in the folded
+format of flamegraph.pl and speedscope on exit:
+
+    python main.py --profile-frames frames.folded
+    flamegraph.pl frames.folded > frames.svg
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# Frames the rolling percentiles are computed over
+FRAME_WINDOW = 300
+# Sections listed in the overlay, the slowest (by p95) first
+OVERLAY_SECTIONS = 8
+
+_NO_SECTION = nullcontext()
+
+
+def percentile(values, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))] if values else 0.0
+
+
+class FrameProfiler:
+    """
+    Does nothing until start() is called, section() then costs one attribute check.
+    Only the thread running the main loop is timed.
+    """
+
+    def __init__(self, window: int = FRAME_WINDOW):
+        self.enabled = False
+        self.window = window
+        self.frames = 0
+        # stack -> seconds spent in it in each of the recent frames it ran in
+        self.samples: dict[str, deque[float]] = {}
+        # stack -> self time (without the sections inside) over the whole run, for the flamegraph
+        self.folded: dict[str, float] = {}
+        self._stack: list[str] = []
+        # time spent in the sections inside each open section
+        self._child_time: list[float] = []
+        self._frame: dict[str, float] = {}
+        self._frame_start = 0.0
+        self._thread = None
+
+    def start(self):
+        self.enabled = True
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self._thread = threading.get_ident()
+        self._frame = {}
+        self._stack = ["frame"]
+        self._child_time = [0.0]
+        self._frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if not self.enabled or not self._stack:
+            return
+        elapsed = time.perf_counter() - self._frame_start
+        self._add("frame", elapsed, elapsed - self._child_time[0])
+        for stack, seconds in self._frame.items():
+            if stack not in self.samples:
+                self.samples[stack] = deque(maxlen=self.window)
+            self.samples[stack].append(seconds)
+        self.frames += 1
+        self._stack = []
+
+    def section(self, name: str):
+        """
+        Context manager timing the code in it as part of the current frame
+        """
+        if not self.enabled or not self._stack or threading.get_ident() != self._thread:
+            return _NO_SECTION
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        self._stack.append(name)
+        self._child_time.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack = ";".join(self._stack)
+            self._stack.pop()
+            child_time = self._child_time.pop()
+            self._child_time[-1] += elapsed
+            self._add(stack, elapsed, elapsed - child_time)
+
+    def _add(self, stack: str, elapsed: float, self_time: float):
+        self._frame[stack] = self._frame.get(stack, 0.0) + elapsed
+        self.folded[stack] = self.folded.get(stack, 0.0) + self_time
+
+    def percentiles(self, stack: str) -> tuple[float, float, float]:
+        """
+        p50, p95 and p99 of the time per frame spent in stack, in seconds
+        """
+        samples = self.samples.get(stack, ())
+        return percentile(samples, 0.5), percentile(samples, 0.95), percentile(samples, 0.99)
+
+    def overlay_lines(self, count: int = OVERLAY_SECTIONS) -> list[str]:
+        if not self.samples:
+            return ["No frames profiled yet"]
+        lines = ["Frame (ms)  p50 / p95 / p99"]
+        stacks = ["frame"] + sorted((stack for stack in self.samples if stack != "frame"),
+                                    key=lambda stack: self.percentiles(stack)[1], reverse=True)[:count]
+        for stack in stacks:
+            p50, p95, p99 = self.percentiles(stack)
+            name = stack.removeprefix("frame;").replace(";", " > ")
+            lines.append(f"{name}: {p50 * 1000:.2f} / {p95 * 1000:.2f} / {p99 * 1000:.2f}")
+        return lines
+
+    def dump_folded(self, path: str):
+        """
+        Write one "stack microseconds" line per stack
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, seconds in sorted(self.folded.items()):
+                microseconds = round(seconds * 1_000_000)
+                if microseconds > 0:
+                    file.write(f"{stack} {microseconds}\n")
+
+
+profiler = FrameProfiler()
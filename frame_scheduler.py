@@ -0,0 +1,70 @@
+import time
+from collections import deque
+import pygame
+
+# Frame rate while something is moving on screen
+TARGET_FPS = 60
+# Frame rate when nothing animates. Also covers the caret blink (toggles every 0.5 s)
+IDLE_FPS = 10
+# Show the measured frame time in the window title
+SHOW_FRAME_TIME = False
+
+# Posted from other threads to wake up a main loop that is waiting for events
+WAKE_EVENT = pygame.event.custom_type()
+
+
+def wake_up():
+    """
+    Make the main loop draw a new frame as soon as possible. Safe to call from any thread.
+    """
+    if pygame.display.get_init():
+        pygame.event.post(pygame.event.Event(WAKE_EVENT))
+
+
+class FrameScheduler:
+    """
+    Limits how often the main loop runs. While animating it ticks at target_fps, otherwise it blocks on
+    pygame.event.wait so an idle screen costs (almost) no CPU.
+    """
+
+    def __init__(self, target_fps: int = TARGET_FPS, idle_fps: int = IDLE_FPS):
+        self.target_fps = target_fps
+        self.idle_fps = idle_fps
+        self.clock = pygame.time.Clock()
+        # How long the work of recent frames took, in seconds
+        self.frame_times: deque[float] = deque(maxlen=120)
+        self._frame_start = time.perf_counter()
+        self._last_title_update = 0.0
+
+    def next_events(self, animating: bool) -> list[pygame.event.Event]:
+        """
+        Wait until the next frame should be drawn and return the events that arrived meanwhile
+        """
+        if animating:
+            self.clock.tick(self.target_fps)
+            events = pygame.event.get()
+        else:
+            first = pygame.event.wait(1000 // self.idle_fps)
+            events = [] if first.type == pygame.NOEVENT else [first]
+            events += pygame.event.get()
+            # keep the clock in sync for get_fps
+            self.clock.tick()
+        self._frame_start = time.perf_counter()
+        return events
+
+    def end_frame(self):
+        self.frame_times.append(time.perf_counter() - self._frame_start)
+        if SHOW_FRAME_TIME and self._frame_start - self._last_title_update > 1:
+            self._last_title_update = self._frame_start
+            pygame.display.set_caption(f"Epic murder mystery game - {self.get_frame_time() * 1000:.1f} ms/frame, {self.clock.get_fps():.0f} FPS")
+
+    def get_frame_time(self) -> float:
+        """
+        Average time spent on one frame (events, update and drawing) in seconds
+        """
+        if not self.frame_times:
+            return 0.0
+        return sum(self.frame_times) / len(self.frame_times)
+
+    def get_fps(self) -> float:
+        return self.clock.get_fps()
@@ -1,4 +1,9 @@
+import logging
 import random
+import sys
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
 
 PLACES = [
     "House",
@@ -16,14 +21,56 @@ PLAYER_NAMES = [
     "Alice", "Bob", "Carol"#, "Dave"
 ]
 
+def phase_name(phase: int) -> str:
+    # Longer games (simulation sweeps) run past the named phases
+    if phase < len(PHASE_LOOKUP):
+        return PHASE_LOOKUP[phase]
+    return f"Phase {phase}"
+
+# Observation kinds
+SAW = "saw"
+KILL = "kill"
+HEARD = "heard"
+
+class Observation(NamedTuple):
+    """
+    Something a character saw or heard. Everyone who saw the same thing shares one record,
+    it is only turned into text (str()) when a prompt is built.
+    """
+    kind: str
+    # SAW: everyone in the place, KILL: (killer, victim), HEARD: (speaker,)
+    names: tuple[str, ...]
+    place: str
+    phase: int
+    # what was said, for HEARD
+    text: str = ""
+
+    def __str__(self):
+        if self.kind == KILL:
+            return f"{self.names[0]} killed {self.names[1]} in {self.place} at {phase_name(self.phase)}"
+        if self.kind == HEARD:
+            return f"{self.names[0]} said: {self.text}"
+        return f"{list(self.names)} in {self.place} at {phase_name(self.phase)}"
+
+    def as_dict(self) -> dict:
+        return {"kind": self.kind, "names": list(self.names), "place": self.place, "phase": self.phase, "text": self.text}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Observation":
+        return cls(data["kind"], tuple(sys.intern(name) for name in data["names"]), sys.intern(data["place"]),
+                   data["phase"], data.get("text", ""))
+
 class Character:
-    def __init__(self, name):
-        self.name = name
+    __slots__ = ("name", "alive", "plan", "history", "seen", "heard")
+
+    def __init__(self, name, rng: random.Random = random, places: list[str] = PLACES, states: int = STATES):
+        # Names and places are interned so every record mentioning them shares one string
+        self.name = sys.intern(name)
         self.alive = True
-        self.plan = [random.choice(PLACES) for i in range(STATES)]
+        self.plan = [sys.intern(rng.choice(places)) for i in range(states)]
         self.history = [self.plan.pop(0)]
-        self.seen = []
-        self.heard = []
+        self.seen: list[Observation] = []
+        self.heard: list[Observation] = []
 
     def kill(self):
         self.alive = False
@@ -60,7 +107,29 @@ class Character:
     def get_history(self):
         return self.history
     
-    def advance(self, next_phase, seen, place = None):
+    def snapshot(self) -> dict:
+        # Records shared between characters are stored once per character, from_snapshot does not share them again
+        return {
+            "name": self.name,
+            "alive": self.alive,
+            "plan": list(self.plan),
+            "history": list(self.history),
+            "seen": [seen.as_dict() for seen in self.seen],
+            "heard": [heard.as_dict() for heard in self.heard],
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "Character":
+        c = cls.__new__(cls)
+        c.name = sys.intern(data["name"])
+        c.alive = data["alive"]
+        c.plan = [sys.intern(place) for place in data["plan"]]
+        c.history = [sys.intern(place) for place in data["history"]]
+        c.seen = [Observation.from_dict(seen) for seen in data["seen"]]
+        c.heard = [Observation.from_dict(heard) for heard in data["heard"]]
+        return c
+
+    def advance(self, next_phase, seen: Observation, place = None):
         if place is None:
             if self.plan:
                 place = self.plan.pop(0)
@@ -68,23 +137,73 @@ class Character:
                 place = self.get_current_place()
                 
 
-        self.add_seen(f"{seen} in {self.get_current_place()} at {PHASE_LOOKUP[next_phase-1]}")
-        self.history.append(place)
+        self.add_seen(seen)
+        self.history.append(sys.intern(place))
 
 
 
 class Game():
 
-    def __init__(self):
-        self.characters = {name: Character(name) for name in PLAYER_NAMES}
-        self.player = Character(PLAYER_NAME)
+    def __init__(self, names: list[str] = PLAYER_NAMES, places: list[str] = PLACES, states: int = STATES, rng: random.Random = random):
+        self.places = places
+        self.states = states
+        self.characters = {name: Character(name, rng, places, states) for name in names}
+        self.player = Character(PLAYER_NAME, rng, places, states)
         self.characters[PLAYER_NAME] = self.player
+        # name of the character the player must kill
         self.target = None
 
         self.game_phase = 0
+        self._init_occupancy()
+
+    def _init_occupancy(self):
+        # place -> {name: character} of everyone (dead or alive) currently there, kept up to date by advance
+        self.occupancy: dict[str, dict[str, Character]] = {}
+        for c in self.characters.values():
+            self.occupancy.setdefault(c.get_current_place(), {})[c.get_name()] = c
+        self.occupancy_listeners = []
+
+    def snapshot(self) -> dict:
+        """
+        Full game state as JSON compatible data, see from_snapshot
+        """
+        return {
+            "places": list(self.places),
+            "states": self.states,
+            "game_phase": self.game_phase,
+            "target": self.target,
+            "characters": [c.snapshot() for c in self.characters.values()],
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "Game":
+        """
+        Restore a game from snapshot(), it continues exactly like the original would have
+        """
+        game = cls.__new__(cls)
+        game.places = data["places"]
+        game.states = data["states"]
+        game.game_phase = data["game_phase"]
+        game.target = data["target"]
+        characters = [Character.from_snapshot(c) for c in data["characters"]]
+        game.characters = {c.get_name(): c for c in characters}
+        game.player = game.characters[PLAYER_NAME]
+        game._init_occupancy()
+        return game
+
+    def add_occupancy_listener(self, listener):
+        """
+        listener(place) is called after the people in place or their alive state changed
+        """
+        self.occupancy_listeners.append(listener)
+
+    def _notify_occupancy(self, places):
+        for place in places:
+            for listener in self.occupancy_listeners:
+                listener(place)
 
     def people_in_room(self, room):
-        return [c for c in self.characters.values() if c.get_current_place() == room]
+        return list(self.occupancy.get(room, {}).values())
 
     def get_characters(self):
         return self.characters
@@ -93,15 +212,17 @@ class Game():
         return self.player
 
     def get_time(self):
-        return PHASE_LOOKUP[min(STATES-1,self.game_phase)]
+        return phase_name(min(self.states-1,self.game_phase))
     
     def get_place(self, index):
-        return PLACES[index]
+        return self.places[index]
     
     def kill_character(self, c: Character):
         c.kill()
+        seen = Observation(KILL, (PLAYER_NAME, c.get_name()), c.get_current_place(), min(self.states-1, self.game_phase))
         for person in self.people_in_room(c.get_current_place()):
-            person.add_seen(f"{PLAYER_NAME} killed {c.get_name()} in {c.get_current_place()} at {self.get_time()}")
+            person.add_seen(seen)
+        self._notify_occupancy([c.get_current_place()])
 
     def killed_people(self) -> list[str]:
         return [c.get_name() for c in self.characters.values() if not c.is_alive()]
@@ -110,25 +231,39 @@ class Game():
         return [c for c in self.characters.values() if c.is_alive()]
 
     def advance(self, player_move):
-        if self.game_phase >= STATES:
+        if self.game_phase >= self.states:
             return
         t = self.game_phase
+        # Everyone sees the people in the same place, group them once instead of comparing every pair.
+        # Everyone in a place shares one observation of it.
+        names_in_place: dict[str, list[str]] = {}
         for c in self.characters.values():
-            if c.is_alive():
-                seen = [character.get_name() for character in self.characters.values() if character.get_current_place() == c.get_current_place()]
-                print(f"{c.get_name()} saw: {seen} in {c.get_current_place()}")
-                
-        for c in self.characters.values():
-            print(f"{c.get_name()} has heard: {c.heard}")
+            names_in_place.setdefault(c.get_current_place(), []).append(c.get_name())
+        seen_in_place = {place: Observation(SAW, tuple(names), place, t) for place, names in names_in_place.items()}
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for c in self.characters.values():
+                if c.is_alive():
+                    logger.debug(f"{c.get_name()} saw: {list(seen_in_place[c.get_current_place()].names)} in {c.get_current_place()}")
+            for c in self.characters.values():
+                logger.debug(f"{c.get_name()} has heard: {[str(heard) for heard in c.heard]}")
 
+        changed_places = set()
         for c in self.characters.values():
             if c.is_alive():
+                old_place = c.get_current_place()
+                seen = seen_in_place[old_place]
                 if c == self.player:
                     c.advance(t + 1, seen, player_move)
                 else:
                     # randomly pick seen/heard to tell others
                     c.advance(t+1, seen)
+                if c.get_current_place() != old_place:
+                    del self.occupancy[old_place][c.get_name()]
+                    self.occupancy.setdefault(c.get_current_place(), {})[c.get_name()] = c
+                    changed_places.update((old_place, c.get_current_place()))
         self.game_phase += 1
+        self._notify_occupancy(changed_places)
 
 
 
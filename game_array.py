@@ -0,0 +1,267 @@
+"""
+NumPy-backed alternative to game.Game for big towns and simulation sweeps.
+Places are integer IDs, where everyone is at every phase is one characters x phases matrix and
+who saw whom is never stored: it is everyone with the same place ID in the same column.
+Character objects are replaced by thin CharacterView objects with the same methods.
+"""
+import logging
+import random
+import sys
+import numpy as np
+from collections.abc import MutableSequence
+from game import KILL, PLACES, PLAYER_NAME, PLAYER_NAMES, SAW, STATES, Observation, phase_name
+
+logger = logging.getLogger(__name__)
+
+# Plan entry meaning "stay where you are", used after the last planned phase
+STAY = -1
+# Kill order of characters that are still alive
+NOT_KILLED = np.iinfo(np.int32).max
+
+
+class PlanView(MutableSequence):
+    """
+    The remaining plan of one character as a list of place names, backed by the plan matrix.
+    Conversation.apply_final_output edits plans through this.
+    """
+
+    def __init__(self, game: "ArrayGame", index: int):
+        self.game = game
+        self.index = index
+
+    def _row(self) -> np.ndarray:
+        # Remaining plan starts at the next phase, the last column is always STAY
+        return self.game.plans[self.index, self.game.game_phase + 1:self.game.states]
+
+    def __len__(self):
+        return len(self._row())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.game.places[place] for place in self._row()[i]]
+        return self.game.places[self._row()[i]]
+
+    def __setitem__(self, i, place):
+        self._row()[i] = self.game.place_id(place)
+
+    def __delitem__(self, i):
+        row = self._row()
+        remaining = list(row)
+        del remaining[i]
+        row[:] = remaining + [row[-1]] * (len(row) - len(remaining))
+
+    def insert(self, i, place):
+        # Plans cannot grow past the end of the game, the last planned place falls off
+        row = self._row()
+        remaining = list(row)
+        remaining.insert(i, self.game.place_id(place))
+        row[:] = remaining[:len(row)]
+
+    def append(self, place):
+        # Only the phases left in the game can be planned
+        pass
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class CharacterView:
+    """
+    Same methods as game.Character, but reads and writes the arrays of an ArrayGame
+    """
+    __slots__ = ("game", "index", "name", "heard", "extra_seen")
+
+    def __init__(self, game: "ArrayGame", index: int, name: str):
+        self.game = game
+        self.index = index
+        self.name = sys.intern(name)
+        self.heard: list[Observation] = []
+        # observations added from outside the game (the arrays hold the rest)
+        self.extra_seen: list[Observation] = []
+
+    @property
+    def plan(self) -> PlanView:
+        return PlanView(self.game, self.index)
+
+    def kill(self):
+        self.game.kill_index(self.index)
+
+    def is_alive(self):
+        return bool(self.game.alive[self.index])
+
+    def get_name(self):
+        return self.name
+
+    def get_current_place(self):
+        return self.game.places[self.game.locations[self.index, self.game.game_phase]]
+
+    def get_place(self, phase):
+        return self.get_history()[phase]
+
+    def get_plans(self):
+        return self.plan
+
+    def get_history(self):
+        return [self.game.places[place] for place in self.game.locations[self.index, :self._history_length()]]
+
+    def _history_length(self) -> int:
+        # Dead characters stop moving, their history ends at the phase they died in
+        death_phase = self.game.death_phase[self.index]
+        return min(self.game.game_phase, death_phase) + 1
+
+    def get_seen(self):
+        return self.game.observations(self.index) + self.extra_seen
+
+    def get_heard(self):
+        return self.heard
+
+    def add_heard(self, heard):
+        if self.is_alive():
+            self.heard.append(heard)
+
+    def add_seen(self, seen_msg):
+        if self.is_alive():
+            self.extra_seen.append(seen_msg)
+
+
+class ArrayGame:
+    """
+    Drop-in replacement for game.Game backed by NumPy arrays, so advancing a town of thousands of villagers
+    takes milliseconds. rng can be a random.Random (like Game) or a numpy Generator.
+    """
+
+    def __init__(self, names: list[str] = PLAYER_NAMES, places: list[str] = PLACES, states: int = STATES, rng=random):
+        self.places = list(places)
+        self._place_ids = {place: i for i, place in enumerate(self.places)}
+        self.states = states
+        if not isinstance(rng, np.random.Generator):
+            rng = np.random.default_rng(rng.getrandbits(64))
+
+        all_names = list(names) + [PLAYER_NAME]
+        count = len(all_names)
+        self.player_index = count - 1
+
+        # plans[c, t] is where c plans to be at phase t, locations[c, t] where c actually was
+        self.plans = np.full((count, states + 1), STAY, dtype=np.int32)
+        self.plans[:, :states] = rng.integers(0, len(self.places), size=(count, states), dtype=np.int32)
+        self.locations = np.zeros((count, states + 1), dtype=np.int32)
+        self.locations[:, 0] = self.plans[:, 0]
+        self.alive = np.ones(count, dtype=bool)
+        self.death_phase = np.full(count, NOT_KILLED, dtype=np.int32)
+        self.kill_order = np.full(count, NOT_KILLED, dtype=np.int32)
+        # (victim, place, phase) for every kill, in order
+        self.kills: list[tuple[int, int, int]] = []
+
+        self.views = [CharacterView(self, i, name) for i, name in enumerate(all_names)]
+        self.characters = {view.get_name(): view for view in self.views}
+        self.player = self.views[self.player_index]
+        self.target = None
+
+        self.game_phase = 0
+        self.occupancy_listeners = []
+
+    def add_occupancy_listener(self, listener):
+        """
+        listener(place) is called after the people in place or their alive state changed, like in Game
+        """
+        self.occupancy_listeners.append(listener)
+
+    def _notify_occupancy(self, places):
+        for place in places:
+            for listener in self.occupancy_listeners:
+                listener(self.places[place])
+
+    def place_id(self, place: str) -> int:
+        """
+        ID of a place name. Unknown names (an LLM can plan anything) get a new ID.
+        """
+        if place not in self._place_ids:
+            self._place_ids[place] = len(self.places)
+            self.places.append(place)
+        return self._place_ids[place]
+
+    def people_in_room(self, room):
+        place = self._place_ids.get(room)
+        if place is None:
+            return []
+        indices = np.flatnonzero(self.locations[:, self.game_phase] == place)
+        return [self.views[i] for i in indices]
+
+    def colocation_counts(self, phase: int | None = None) -> np.ndarray:
+        """
+        For every character, how many characters (including itself) were in the same place at phase
+        """
+        column = self.locations[:, self.game_phase if phase is None else phase]
+        return np.bincount(column, minlength=len(self.places))[column]
+
+    def get_characters(self):
+        return self.characters
+
+    def get_player(self):
+        return self.player
+
+    def get_time(self):
+        return phase_name(min(self.states-1, self.game_phase))
+
+    def get_place(self, index):
+        return self.places[index]
+
+    def kill_index(self, index: int):
+        if not self.alive[index]:
+            return
+        self.alive[index] = False
+        self.death_phase[index] = self.game_phase
+        self.kill_order[index] = len(self.kills)
+        self.kills.append((index, int(self.locations[index, self.game_phase]), self.game_phase))
+        self._notify_occupancy([self.locations[index, self.game_phase]])
+
+    def kill_character(self, c: CharacterView):
+        self.kill_index(c.index)
+
+    def killed_people(self) -> list[str]:
+        return [self.views[i].get_name() for i in np.flatnonzero(~self.alive)]
+
+    def alive_people(self) -> list[CharacterView]:
+        return [self.views[i] for i in np.flatnonzero(self.alive)]
+
+    def advance(self, player_move):
+        if self.game_phase >= self.states:
+            return
+        t = self.game_phase
+        if logger.isEnabledFor(logging.DEBUG):
+            counts = self.colocation_counts(t)
+            for i in np.flatnonzero(self.alive):
+                logger.debug(f"{self.views[i].get_name()} saw {counts[i] - 1} others in {self.places[self.locations[i, t]]}")
+
+        # Alive characters follow their plan (or stay when it ran out), the dead stay where they are
+        planned = self.plans[:, t + 1]
+        moves = np.where(planned == STAY, self.locations[:, t], planned)
+        self.locations[:, t + 1] = np.where(self.alive, moves, self.locations[:, t])
+        if self.alive[self.player_index]:
+            self.locations[self.player_index, t + 1] = self.place_id(player_move)
+        self.game_phase += 1
+        if self.occupancy_listeners:
+            old, new = self.locations[:, t], self.locations[:, t + 1]
+            moved = np.flatnonzero(old != new)
+            self._notify_occupancy(np.unique(np.concatenate((old[moved], new[moved]))))
+
+    def observations(self, index: int) -> list[Observation]:
+        """
+        Build the observations of one character, the same records in the same order as game.Character.get_seen
+        """
+        messages = []
+        # a kill is seen by everyone alive in the same place, except the victim
+        for kill_number, (victim, place, phase) in enumerate(self.kills):
+            if self.kill_order[index] < kill_number or self.locations[index, phase] != place or victim == index:
+                continue
+            # like Game.get_time, a kill after the last phase is reported at the last phase
+            messages.append((phase, 0, Observation(KILL, (PLAYER_NAME, self.views[victim].get_name()), self.places[place], min(self.states-1, phase))))
+
+        # and the people around it at every phase it advanced from alive
+        for phase in range(min(self.game_phase, self.death_phase[index])):
+            column = self.locations[:, phase]
+            seen = tuple(self.views[i].get_name() for i in np.flatnonzero(column == column[index]))
+            messages.append((phase, 1, Observation(SAW, seen, self.places[column[index]], phase)))
+        # kills happen before the move of the same phase
+        messages.sort(key=lambda message: message[:2])
+        return [message for _, _, message in messages]
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Iterator
+from game import PLACES
+
+# Which backend get_backend() creates: "gemini" or "offline"
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+# Artificial delay of the offline backend, in seconds
+OFFLINE_LATENCY = float(os.environ.get("LLM_OFFLINE_LATENCY", "0"))
+OFFLINE_JITTER = float(os.environ.get("LLM_OFFLINE_JITTER", "0"))
+
+API_KEY_PATH = "GEMINI_API_KEY"
+
+
+class TextResponse:
+    """
+    Response that only carries text, used for cached and offline answers
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class GeminiBackend:
+    """
+    Sends requests to Gemini. The API key is read from the GEMINI_API_KEY file.
+    """
+
+    def __init__(self, key_path: str = API_KEY_PATH):
+        from google import genai
+
+        with open(key_path, "r") as f:
+            api_key = f.readline().rstrip()
+        self.client = genai.Client(api_key=api_key)
+
+    def generate(self, model: str, contents: list, config: dict):
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    def generate_stream(self, model: str, contents: list, config: dict) -> Iterator:
+        return self.client.models.generate_content_stream(model=model, contents=contents, config=config)
+
+
+VILLAGER_LINES = [
+    "Oh, hello there! Lovely weather today, isn't it?",
+    "I was just thinking of heading to the {place} later.",
+    "Can't stay long, I have things to do at the {place}.",
+    "Have you heard anything interesting lately?",
+    "Sure, I could go to the {place} if you think that's a good idea.",
+]
+
+DETECTIVE_LINES = [
+    "Where were you at 9AM?",
+    "Did you see anyone near the {place}?",
+    "Who did you talk to today?",
+    "Did the victim have any enemies?",
+]
+
+
+class OfflineBackend:
+    """
+    Rule-based stand-in for Gemini that needs no network. Answers are deterministic for the same request
+    (and seed), structured requests get JSON that matches the requested schema.
+    latency + a random amount up to jitter is slept before answering.
+    """
+
+    def __init__(self, latency: float = OFFLINE_LATENCY, jitter: float = OFFLINE_JITTER, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+
+    def _rng(self, model: str, contents: list, config: dict) -> random.Random:
+        payload = json.dumps([self.seed, model, contents, config], sort_keys=True, default=str)
+        return random.Random(hashlib.sha256(payload.encode()).hexdigest())
+
+    def _wait(self, rng: random.Random):
+        delay = self.latency + rng.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def generate(self, model: str, contents: list, config: dict) -> TextResponse:
+        rng = self._rng(model, contents, config)
+        self._wait(rng)
+        return TextResponse(self.respond(rng, contents, config))
+
+    def generate_stream(self, model: str, contents: list, config: dict) -> Iterator[TextResponse]:
+        rng = self._rng(model, contents, config)
+        self._wait(rng)
+        words = self.respond(rng, contents, config).split(" ")
+        for i, word in enumerate(words):
+            yield TextResponse(word if i == 0 else " " + word)
+
+    def respond(self, rng: random.Random, contents: list, config: dict) -> str:
+        user_messages = [part["text"] for content in contents if content["role"] == "user" for part in content["parts"]]
+        schema = config.get("response_json_schema")
+        if schema is not None:
+            return json.dumps(self.structured(rng, schema, user_messages))
+
+        system_instruction = config.get("system_instruction") or ""
+        place = rng.choice(PLACES)
+        if "You are a detective" in system_instruction:
+            questions_asked = len(contents) // 2
+            if questions_asked > len(DETECTIVE_LINES):
+                return "Ok, i am done here."
+            return rng.choice(DETECTIVE_LINES).format(place=place)
+        return rng.choice(VILLAGER_LINES).format(place=place)
+
+    def structured(self, rng: random.Random, schema: dict, user_messages: list[str]) -> dict:
+        # Earlier messages are what the other character said since the context update that started the phase
+        # (see ai.Conversation), the last one is the extraction instruction
+        said = user_messages[:-1]
+        updates = [i for i, message in enumerate(said) if message.startswith("Context update:") and "It is currently" in message]
+        if updates:
+            said = said[updates[-1] + 1:]
+        said = [message for message in said if not message.startswith("Context update:")]
+        title = schema.get("title")
+        if title == "AIOutput":
+            mentioned = [word for message in said for word in re.findall(r"\w+", message) if word in PLACES]
+            return {"my_plans": mentioned, "heard": said[-2:]}
+        if title == "BatchOutput":
+            # one section per conversation, see ai.extract_all
+            sections = re.findall(r"Conversation with (\w+)[^\n]*:\n(.*?)(?=\n\nConversation with |\Z)", "\n".join(user_messages), re.S)
+            villagers = []
+            for name, lines in sections:
+                said = [line.split(": ", 1)[1] for line in lines.splitlines() if ": " in line and not line.startswith(f"{name}: ")]
+                mentioned = [word for message in said for word in re.findall(r"\w+", message) if word in PLACES]
+                villagers.append({"name": name, "my_plans": mentioned, "heard": said[-2:]})
+            return {"villagers": villagers}
+        if title == "DetectiveOutput":
+            names = re.findall(r"Interrogation of (\w+)", "\n".join(said))
+            suspect = rng.choice(names) if names else "Nobody"
+            return {"suspect": suspect, "explanation": f"{suspect} could not explain where they were."}
+        return self.fill_schema(rng, schema)
+
+    def fill_schema(self, rng: random.Random, schema: dict):
+        schema_type = schema.get("type")
+        if schema_type == "object":
+            return {name: self.fill_schema(rng, prop) for name, prop in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            return [self.fill_schema(rng, schema.get("items", {})) for _ in range(rng.randint(0, 2))]
+        if schema_type == "integer":
+            return rng.randint(0, 10)
+        if schema_type == "number":
+            return rng.random()
+        if schema_type == "boolean":
+            return rng.random() < 0.5
+        return rng.choice(PLACES)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Backend used by ai.Chat. Created on first use so nothing reads the key file or touches the network on import.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = OfflineBackend() if LLM_BACKEND == "offline" else GeminiBackend()
+        return _backend
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
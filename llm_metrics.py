@@ -0,0 +1,186 @@
+"""
+Latency and token usage of every LLM call, tagged by what the call was for.
+ai.Chat records every request here. The numbers are shown in the in-game overlay (F3)
+and can be written out on exit as JSON or in the Prometheus text format:
+
+    python main.py --llm-metrics llm_metrics.json
+    python main.py --llm-metrics llm_metrics.prom
+"""
+import json
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+# Call kinds
+CHAT = "chat"
+FINALIZE = "finalize"
+DETECTIVE = "detective"
+PRIMING = "priming"
+KINDS = [CHAT, FINALIZE, DETECTIVE, PRIMING]
+
+# Calls kept for percentiles and the slowest/largest lists, the totals count every call
+MAX_RECORDS = 5000
+# Characters of the message kept with every call, enough to recognize the prompt
+PREVIEW_LENGTH = 80
+# Calls listed in the slowest and largest prompt lists of the dump
+TOP_CALLS = 10
+
+
+class CallRecord(NamedTuple):
+    kind: str
+    # seconds from the request until the whole answer arrived, waiting for the rate limit included
+    latency: float
+    # seconds until the first chunk of a streamed answer, None when not streamed
+    first_token: float | None
+    prompt_tokens: int
+    output_tokens: int
+    # prompt tokens Gemini took from its implicit prefix cache
+    cached_tokens: int
+    # answered from the response cache, nothing was sent
+    cache_hit: bool
+    # token counts were estimated from the text because the response had no usage metadata
+    estimated: bool
+    error: str | None
+    preview: str
+    time: float
+
+
+def response_usage(response) -> tuple[int, int, int] | None:
+    """
+    (prompt, output, cached) token counts of a genai response, None if it has no usage metadata
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None or usage.prompt_token_count is None:
+        return None
+    output = (usage.candidates_token_count or 0) + (getattr(usage, "thoughts_token_count", None) or 0)
+    return usage.prompt_token_count, output, usage.cached_content_token_count or 0
+
+
+def percentile(values: list[float], share: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+class LLMMetrics:
+    """
+    Thread-safe collection of CallRecords. version changes with every record, so the overlay knows when to update.
+    """
+
+    def __init__(self, max_records: int = MAX_RECORDS):
+        self.records: deque[CallRecord] = deque(maxlen=max_records)
+        # kind -> counter -> value, over all calls
+        self.totals: dict[str, dict[str, int]] = {}
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, latency: float, first_token: float | None = None, prompt_tokens: int = 0,
+               output_tokens: int = 0, cached_tokens: int = 0, cache_hit: bool = False, estimated: bool = False,
+               error: str | None = None, message: str = ""):
+        record = CallRecord(kind, latency, first_token, prompt_tokens, output_tokens, cached_tokens, cache_hit,
+                            estimated, error, " ".join(message.split())[:PREVIEW_LENGTH], time.time())
+        with self._lock:
+            self.records.append(record)
+            totals = self.totals.setdefault(kind, dict.fromkeys(
+                ("calls", "errors", "cache_hits", "prompt_tokens", "output_tokens", "cached_tokens"), 0))
+            totals["calls"] += 1
+            totals["errors"] += error is not None
+            totals["cache_hits"] += cache_hit
+            totals["prompt_tokens"] += prompt_tokens
+            totals["output_tokens"] += output_tokens
+            totals["cached_tokens"] += cached_tokens
+            self.version += 1
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Totals and latency percentiles per kind. Percentiles are over the kept calls that were sent and did not fail.
+        """
+        with self._lock:
+            records = list(self.records)
+            totals = {kind: dict(counters) for kind, counters in self.totals.items()}
+        summary = {}
+        for kind, counters in totals.items():
+            sent = [r for r in records if r.kind == kind and not r.cache_hit and r.error is None]
+            latencies = [r.latency for r in sent]
+            first_tokens = [r.first_token for r in sent if r.first_token is not None]
+            summary[kind] = {
+                **counters,
+                "latency_p50": percentile(latencies, 0.5),
+                "latency_p95": percentile(latencies, 0.95),
+                "latency_max": max(latencies, default=None),
+                "first_token_p50": percentile(first_tokens, 0.5),
+                "first_token_p95": percentile(first_tokens, 0.95),
+                "max_prompt_tokens": max((r.prompt_tokens for r in sent), default=0),
+            }
+        return summary
+
+    def top(self, key, count: int = TOP_CALLS) -> list[CallRecord]:
+        with self._lock:
+            records = [r for r in self.records if not r.cache_hit]
+        return sorted(records, key=key, reverse=True)[:count]
+
+    def overlay_lines(self) -> list[str]:
+        """
+        One line per kind for the in-game overlay
+        """
+        def seconds(value):
+            return "-" if value is None else f"{value:.2f}s"
+
+        lines = []
+        for kind, s in sorted(self.summary().items(), key=lambda item: KINDS.index(item[0]) if item[0] in KINDS else len(KINDS)):
+            lines.append(f"{kind}: {s['calls']} calls ({s['cache_hits']} cached, {s['errors']} failed),"
+                         f" p50 {seconds(s['latency_p50'])} p95 {seconds(s['latency_p95'])} first token {seconds(s['first_token_p50'])},"
+                         f" {s['prompt_tokens']} prompt / {s['output_tokens']} output tokens, largest prompt {s['max_prompt_tokens']}")
+        return lines or ["No LLM calls yet"]
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            records = [r._asdict() for r in self.records]
+        return {
+            "summary": self.summary(),
+            "slowest": [r._asdict() for r in self.top(lambda r: r.latency)],
+            "largest_prompts": [r._asdict() for r in self.top(lambda r: r.prompt_tokens)],
+            "calls": records,
+        }
+
+    def prometheus(self) -> str:
+        """
+        Summary in the Prometheus text exposition format
+        """
+        summary = self.summary()
+        lines = []
+        for name, counter, help_text in [
+            ("llm_calls_total", "calls", "LLM calls"),
+            ("llm_errors_total", "errors", "LLM calls that failed"),
+            ("llm_cache_hits_total", "cache_hits", "LLM calls answered from the response cache"),
+            ("llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens sent"),
+            ("llm_output_tokens_total", "output_tokens", "Output tokens generated"),
+            ("llm_cached_tokens_total", "cached_tokens", "Prompt tokens served from the prefix cache"),
+        ]:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{kind="{kind}"}} {s[counter]}' for kind, s in summary.items()]
+        for name, prefix, help_text in [
+            ("llm_latency_seconds", "latency", "Time until the whole answer arrived"),
+            ("llm_first_token_seconds", "first_token", "Time until the first chunk of a streamed answer"),
+        ]:
+            # quantiles of the kept calls, not a cumulative summary, so these are gauges
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for kind, s in summary.items():
+                for quantile in ("50", "95"):
+                    value = s[f"{prefix}_p{quantile}"]
+                    if value is not None:
+                        lines.append(f'{name}{{kind="{kind}",quantile="0.{quantile}"}} {value:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """
+        Write the metrics to path, in the Prometheus format for .prom and .txt files and as JSON otherwise
+        """
+        text = self.prometheus() if path.endswith((".prom", ".txt")) else json.dumps(self.as_dict(), indent=2)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+
+metrics = LLMMetrics()
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Queue, Empty
+import rate_limit
+
+# How many LLM requests may be running at the same time
+MAX_IN_FLIGHT = 8
+# Seconds before a single request is given up
+REQUEST_TIMEOUT = 60
+
+
+class LLMService:
+    """
+    Runs blocking LLM calls (Conversation, DetectiveConversation) on one asyncio event loop living in a background thread.
+    Results are handed back to the pygame loop through a thread-safe queue, see process_results().
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, timeout: float = REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self.results: Queue = Queue()
+        # Called from the worker threads whenever a result is queued
+        self.on_result = None
+        self._pending: dict[object, set[Future]] = {}
+        # id of owner -> how often its requests were cancelled. Results queued in an earlier generation are dropped.
+        self._generations: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        # Reuse a fixed set of worker threads instead of starting one per request
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm"))
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llm-service")
+        self._thread.daemon = True
+        self._thread.start()
+
+    async def _call(self, fn, args, timeout: float, priority: int | None = None, cancel: threading.Event | None = None):
+        cancel = cancel or threading.Event()
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(asyncio.to_thread(_run, fn, args, priority, cancel), timeout)
+            except BaseException:
+                # timed out or cancelled: the worker thread cannot be stopped, but it does not send or retry anymore
+                cancel.set()
+                raise
+
+    def _track(self, owner, future: Future):
+        with self._lock:
+            self._pending.setdefault(owner, set()).add(future)
+
+    def _untrack(self, owner, future: Future):
+        with self._lock:
+            futures = self._pending.get(owner)
+            if futures is not None:
+                futures.discard(future)
+                if not futures:
+                    del self._pending[owner]
+
+    def _generation(self, owner) -> int:
+        with self._lock:
+            return self._generations.get(id(owner), 0)
+
+    def _put_result(self, owner, generation: int, callback, result):
+        self.results.put((owner, generation, callback, result))
+        if self.on_result is not None:
+            self.on_result()
+
+    def _schedule(self, coro, owner, callback, on_error, generation: int | None = None) -> Future:
+        generation = self._generation(owner) if generation is None else generation
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        self._track(owner, future)
+
+        def done(f: Future):
+            self._untrack(owner, f)
+            if f.cancelled():
+                return
+            error = f.exception()
+            if error is None:
+                if callback is not None:
+                    self._put_result(owner, generation, callback, f.result())
+            elif on_error is not None:
+                self._put_result(owner, generation, on_error, error)
+            else:
+                print(f"LLM request failed: {error!r}")
+
+        future.add_done_callback(done)
+        return future
+
+    def submit(self, fn, *args, owner=None, callback=None, on_error=None, timeout: float | None = None,
+               priority: int | None = None) -> Future:
+        """
+        Run fn(*args) on the service. callback(result) or on_error(exception) is called from process_results(),
+        so on the thread that polls the service. Requests are grouped by owner so they can be cancelled together.
+        priority (see rate_limit) decides who goes first when the rate limit is reached.
+        """
+        return self._schedule(self._call(fn, args, timeout or self.timeout, priority), owner, callback, on_error)
+
+    def gather(self, calls: list[tuple], owner=None, callback=None, on_error=None, timeout: float | None = None,
+               priority: int | None = None) -> Future:
+        """
+        Run every (fn, *args) in calls concurrently. callback gets the list of results in the same order
+        once all of them are done. A call that failed or timed out has its exception in the list,
+        so one failure does not lose the other results.
+        """
+        async def run_all():
+            return await asyncio.gather(*(self._call(call[0], call[1:], timeout or self.timeout, priority) for call in calls),
+                                        return_exceptions=True)
+
+        return self._schedule(run_all(), owner, callback, on_error)
+
+    def submit_stream(self, fn, *args, owner=None, on_chunk=None, callback=None, on_error=None, timeout: float | None = None,
+                      priority: int | None = None) -> Future:
+        """
+        Like submit, but fn(*args) returns an iterator of text chunks. on_chunk(chunk) is called for every chunk
+        as it arrives and callback(full_text) once the stream has ended.
+        """
+        stopped = threading.Event()
+        generation = self._generation(owner)
+
+        def consume():
+            chunks = []
+            for chunk in fn(*args):
+                if stopped.is_set():
+                    break
+                chunks.append(chunk)
+                if on_chunk is not None:
+                    self._put_result(owner, generation, on_chunk, chunk)
+            return "".join(chunks)
+
+        future = self._schedule(self._call(consume, (), timeout or self.timeout, priority, stopped), owner, callback, on_error, generation)
+        # stop reading the stream if the request timed out or was cancelled
+        future.add_done_callback(lambda f: stopped.set())
+        return future
+
+    def call(self, fn, *args, timeout: float | None = None, priority: int | None = None):
+        """
+        Blocking version of submit for code that already runs in a worker thread.
+        Still obeys the in-flight limit and the timeout.
+        """
+        return asyncio.run_coroutine_threadsafe(self._call(fn, args, timeout or self.timeout, priority), self.loop).result()
+
+    def is_busy(self, owner) -> bool:
+        with self._lock:
+            return bool(self._pending.get(owner))
+
+    def cancel(self, owner):
+        """
+        Cancel every pending request of owner. Their callbacks will never be called.
+        """
+        with self._lock:
+            futures = self._pending.pop(owner, set())
+            # results that already finished but were not processed yet are skipped by process_results
+            self._generations[id(owner)] = self._generations.get(id(owner), 0) + 1
+        for future in futures:
+            future.cancel()
+
+    def process_results(self):
+        """
+        Call the callbacks of finished requests. Must be called from the pygame loop.
+        """
+        while True:
+            try:
+                owner, generation, callback, result = self.results.get_nowait()
+            except Empty:
+                return
+            if generation == self._generation(owner):
+                callback(result)
+
+
+def _run(fn, args, priority: int | None, cancel: threading.Event):
+    # Runs in a worker thread, the priority and the cancel event are picked up by rate_limit for every request fn makes
+    with rate_limit.cancel_on(cancel):
+        if priority is None:
+            return fn(*args)
+        with rate_limit.priority(priority):
+            return fn(*args)
+
+
+_service: LLMService | None = None
+
+def get_service() -> LLMService:
+    global _service
+    if _service is None:
+        _service = LLMService()
+    return _service
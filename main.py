@@ -1,10 +1,19 @@
+import sys
+# Must be set up before the other imports, so that their cost is measured too
+STARTUP_DIAGNOSTICS = __name__ == "__main__" and "--startup-diagnostics" in sys.argv
+if STARTUP_DIAGNOSTICS:
+    import startup_diagnostics
+    startup_diagnostics.install()
+
+import argparse
+import logging
 import pygame
 import random
-import sys
 import threading
-from time import sleep
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Self
-from queue import Queue
+from queue import Empty, Queue
 from game import Game, PLAYER_NAME, STATES, Character, PHASE_LOOKUP
 from ui_room import RoomGUI
 from ui_button import Button
@@ -12,22 +21,65 @@ from ui_textinput import TextInput
 from ui_textarea import TextArea
 from ui_clock import Clock as ClockGUI
 from ui_speech import SpeechBubble
-from ai import Conversation, DetectiveConversation
+from ui_overlay import Overlay
+from ai import Conversation, DetectiveConversation, SessionPool, extract_all, warm_up
+from llm_service import get_service
+from rate_limit import BACKGROUND, DETECTIVE, INTERACTIVE, SPECULATIVE
+from frame_scheduler import FrameScheduler, wake_up
+from ui_render import DirtyRenderer
+from event_log import EventLog, replay
+from llm_metrics import DETECTIVE as DETECTIVE_KIND, PRIMING, metrics as llm_metrics
+from frame_profiler import profiler
 
 WIDTH, HEIGHT = 1280, 720
 BG_COLOR = (255, 255, 255)
+# Show villager answers token by token as they are generated
+STREAM_RESPONSES = True
+# Start generating a greeting as soon as a villager in the same room is selected
+PREFETCH_OPENERS = True
+# Summarize all conversations of a turn with one request instead of one per conversation
+BATCHED_EXTRACTION = True
+# Seconds the detective waits for the player's answer before moving on
+PLAYER_ANSWER_TIMEOUT = 300
+# Greetings per turn that may be thrown away (selection changed first) before prefetching stops until the next turn
+MAX_WASTED_PREFETCHES = 3
+# Key that shows or hides the LLM latency and token overlay
+LLM_METRICS_KEY = pygame.K_F3
+# Key that shows or hides the frame time overlay when profiling with --profile-frames
+FRAME_PROFILE_KEY = pygame.K_F4
+# Seconds between updates of the frame time overlay, so it stays readable
+FRAME_PROFILE_OVERLAY_INTERVAL = 0.5
+
+# Replaced by a log writing to a file with --event-log, the default one writes nothing
+event_log = EventLog()
 
 class IWindow:
+    # shared by all windows, so the overlay stays on after a window change
+    show_llm_metrics = False
+    show_frame_profile = True
+
     def __init__(self, screen: pygame.Surface):
         self.screen = screen
         self.block_interaction = False
         self.is_waiting = False
         self.speech_queue: Queue[SpeechBubble] = Queue()
         self.active_speech: SpeechBubble | None = None
-
-    def add_speech_to_queue(self, character_name: str, text: str):
-        speech = SpeechBubble(character_name, text)
+        self.llm = get_service()
+        # new LLM results wake up an idle main loop
+        self.llm.on_result = wake_up
+        self.frame_scheduler = FrameScheduler()
+        self.renderer = DirtyRenderer(screen, BG_COLOR)
+        self.event_log = event_log
+        self.llm_overlay = Overlay((10, HEIGHT - 90))
+        self._llm_metrics_version = -1
+        self.frame_overlay = Overlay((WIDTH - 10, HEIGHT - 10))
+        self._frame_overlay_updated = 0.0
+
+    def add_speech_to_queue(self, character_name: str, text: str, streaming: bool = False) -> SpeechBubble:
+        speech = SpeechBubble(character_name, text, streaming)
         self.speech_queue.put(speech)
+        wake_up()
+        return speech
     
     def handle_speech(self):
         if not self.speech_queue.empty():
@@ -42,55 +94,164 @@ class IWindow:
             else:
                 self.block_interaction = True
 
+    def is_animating(self) -> bool:
+        """
+        True when the next frames will look different even without input, so the loop runs at full frame rate
+        """
+        if not self.speech_queue.empty():
+            return True
+        return self.active_speech is not None and not self.active_speech.all_written
+
     def draw_all(self):
         pass # override
 
+    def add_overlay_layers(self):
+        if IWindow.show_llm_metrics:
+            # only rebuilt after a new LLM call was recorded
+            if self._llm_metrics_version != llm_metrics.version:
+                self._llm_metrics_version = llm_metrics.version
+                self.llm_overlay.set_lines(llm_metrics.overlay_lines())
+            self.renderer.add("llm metrics", self.llm_overlay.get_rect(), self.llm_overlay.is_dirty(),
+                              lambda: self.llm_overlay.draw(self.screen))
+        if profiler.enabled and IWindow.show_frame_profile:
+            now = time.perf_counter()
+            if now - self._frame_overlay_updated > FRAME_PROFILE_OVERLAY_INTERVAL:
+                self._frame_overlay_updated = now
+                self.frame_overlay.set_lines(profiler.overlay_lines())
+                # in the bottom right corner
+                rect = self.frame_overlay.get_rect()
+                self.frame_overlay.window_pos = (WIDTH - rect.width - 10, HEIGHT - rect.height - 10)
+            self.renderer.add("frame profile", self.frame_overlay.get_rect(), self.frame_overlay.is_dirty(),
+                              lambda: self.frame_overlay.draw(self.screen))
+
+    def add_speech_layer(self):
+        # Speech bubble is always the topmost layer
+        if self.active_speech != None:
+            speech = self.active_speech
+            self.renderer.add("speech", speech.get_rect(), speech.is_dirty(), lambda: speech.draw(self.screen))
+
     def handle_standard_events(self, event):
         pass # override
 
     def get_next_window(self) -> Self | None:
         return None
 
+    def close(self):
+        """
+        Stop the background work of this window, called when it is replaced or the game quits
+        """
+        # results of this window are not wanted anymore
+        self.llm.cancel(self)
+
+    def is_busy(self) -> bool:
+        return self.is_waiting or self.llm.is_busy(self)
+
     def get_llm_response_async(self, conversation: Conversation, message: str, callback):
-        def worker():
-            self.is_waiting = True # lock mutex
-            response = conversation.send_message(message)
+        started = time.perf_counter()
+
+        def on_response(response):
+            self.event_log.llm(self.game, conversation.character.get_name(), message, response.text, time.perf_counter() - started)
             callback(response)
-            self.is_waiting = False
-        thread = threading.Thread(target=worker)
-        thread.daemon = True
-        thread.start()
+
+        self.llm.submit(conversation.send_message, message, owner=self, callback=on_response, priority=INTERACTIVE,
+                        on_error=lambda error: self.add_speech_to_queue("Error", f"No answer ({error!r})"))
+
+    def stream_llm_response_async(self, conversation: Conversation, message: str, character_name: str):
+        """
+        Stream the answer into a speech bubble. The bubble is queued when the first chunk arrives.
+        """
+        bubble: SpeechBubble | None = None
+        started = time.perf_counter()
+        first_chunk = None
+        chunks: list[str] = []
+
+        def on_chunk(chunk: str):
+            nonlocal bubble, first_chunk
+            if bubble is None:
+                first_chunk = time.perf_counter() - started
+                bubble = self.add_speech_to_queue(character_name, "", streaming=True)
+            chunks.append(chunk)
+            bubble.append_text(chunk)
+
+        def on_end(text: str):
+            self.event_log.llm(self.game, character_name, message, text, time.perf_counter() - started, first_chunk)
+            if bubble is None:
+                self.add_speech_to_queue(character_name, text)
+            else:
+                bubble.end_stream()
+
+        def on_error(error: Exception):
+            self.event_log.llm(self.game, character_name, message, "".join(chunks), time.perf_counter() - started,
+                               first_chunk, error=repr(error))
+            if bubble is None:
+                self.add_speech_to_queue("Error", f"No answer ({error!r})")
+            else:
+                # keep what was already said, and show that the answer was cut off
+                bubble.append_text(f" ... (answer interrupted: {error!r})")
+                bubble.end_stream()
+
+        self.llm.submit_stream(conversation.send_message_stream, message, owner=self, priority=INTERACTIVE,
+                               on_chunk=on_chunk, callback=on_end, on_error=on_error)
 
     def main_loop(self):
         running = True
         while running:
             next_window = self.get_next_window()
             if next_window:
+                self.close()
                 return next_window
-            self.screen.fill(BG_COLOR)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
 
-                # interaction is blocked when speech bubble is shown
-                if not self.block_interaction and not self.is_waiting:
-                    self.handle_standard_events(event)
-
-                if self.active_speech:
-                    self.active_speech.handle_event(event)
-
-            self.handle_speech()
-            self.draw_all()
+            events = self.frame_scheduler.next_events(self.is_animating())
+            # waiting for the frame is not part of the profiled frame
+            profiler.begin_frame()
+            with profiler.section("events"):
+                for event in events:
+                    if event.type == pygame.QUIT:
+                        running = False
+                    if event.type == pygame.KEYDOWN and event.key == LLM_METRICS_KEY:
+                        IWindow.show_llm_metrics = not IWindow.show_llm_metrics
+                        self._llm_metrics_version = -1
+                    if event.type == pygame.KEYDOWN and event.key == FRAME_PROFILE_KEY:
+                        IWindow.show_frame_profile = not IWindow.show_frame_profile
+                        self._frame_overlay_updated = 0.0
+
+                    # interaction is blocked when speech bubble is shown
+                    if not self.block_interaction and not self.is_busy():
+                        self.handle_standard_events(event)
+
+                    if self.active_speech:
+                        self.active_speech.handle_event(event)
+
+            with profiler.section("llm results"):
+                self.llm.process_results()
+            with profiler.section("handle_speech"):
+                self.handle_speech()
+            with profiler.section("draw"):
+                self.draw_all()
+            profiler.end_frame()
+            self.frame_scheduler.end_frame()
+            if STARTUP_DIAGNOSTICS:
+                startup_diagnostics.first_frame()
 
         # end of game loop
+        self.close()
         pygame.quit()
 
 class GameWindow(IWindow):
-    def __init__(self, screen: pygame.Surface, start_msg: str = ""):
+    def __init__(self, screen: pygame.Surface, start_msg: str = "", game: Game | None = None):
+        """
+        game continues a restored game (see event_log.replay) instead of starting a new one
+        """
         IWindow.__init__(self, screen)
-        self.game = Game()
+        self.game = game or Game()
+        # Chat sessions live for the whole game, conversations only has the ones used in this phase
+        self.sessions = SessionPool()
         self.conversations = {}
+        # Speculative greetings have their own LLM owner, so they never make the window busy and can be cancelled alone
+        self.prefetch_owner = object()
+        self.prefetching: str | None = None
+        self.wasted_prefetches = 0
+        self.greeted: set[str] = set()
         self.active_clicked_character = ""
         self.active_clicked_room = ""
         self.rooms = [
@@ -98,11 +259,17 @@ class GameWindow(IWindow):
             RoomGUI(self.game.get_place(1), (900, 100)),
             RoomGUI(self.game.get_place(2), (750, 400))
         ]
+        self.rooms_by_name = {room.room_name: room for room in self.rooms}
+        # Rooms are only rebuilt when the people in them change
+        self.game.add_occupancy_listener(self.update_people_in_room)
         self.init_gui_components()
         if start_msg:
             self.add_speech_to_queue("Info", start_msg)
 
-        self.target_character = random.choice([c for c in self.game.characters.values() if c.get_name() != PLAYER_NAME])
+        if self.game.target is None:
+            self.game.target = random.choice([name for name in self.game.characters if name != PLAYER_NAME])
+        self.target_character = self.game.characters[self.game.target]
+        self.event_log.start(self.game)
         self.add_speech_to_queue("Info", f"Your target is {self.target_character.get_name()}. You must kill this person before {PHASE_LOOKUP[STATES-1]}. \
                                  Don't get caught. Click areas to select where you will move in the next turn. Click characters to interact with them. (Press any key to continue.)")
 
@@ -110,22 +277,58 @@ class GameWindow(IWindow):
         for room in self.rooms:
             room.update(self.game.people_in_room(room.room_name))
 
+    def update_people_in_room(self, place: str):
+        room = self.rooms_by_name.get(place)
+        if room is not None:
+            room.update(self.game.people_in_room(place))
+
     def advance_turn(self, selected_room: str):
-        # End all conversations
-        for conv in self.conversations.values():
-            conv.end_conversation()
+        if self.is_busy():
+            return
+        self.is_waiting = True
+        self.cancel_prefetch()
 
+        # End all conversations with one batched request (or concurrently), the game only advances once every summary is back
+        conversations = list(self.conversations.values())
         self.conversations.clear()
 
+        def callback(outputs):
+            # gather hands back the exception of a failed summary, only that villager misses the update
+            results = []
+            for conv, output in zip(conversations, outputs):
+                if isinstance(output, Exception):
+                    print(f"Summary of the conversation with {conv.character.get_name()} failed: {output!r}")
+                    output = None
+                results.append((conv, output))
+            self.finish_turn(selected_room, results)
+
+        # a failed summary should not freeze the game, advance without the updates
+        on_error = lambda error: self.finish_turn(selected_room, [])
+        if BATCHED_EXTRACTION and len(conversations) > 1:
+            self.llm.submit(extract_all, conversations, owner=self, callback=callback, on_error=on_error, priority=BACKGROUND)
+        else:
+            self.llm.gather([(conv.get_final_output,) for conv in conversations], owner=self,
+                            callback=callback, on_error=on_error, priority=BACKGROUND)
+
+    def finish_turn(self, selected_room: str, results):
+        for conv, output in results:
+            old_plan = list(conv.character.get_plans())
+            heard_before = len(conv.character.get_heard())
+            conv.apply_final_output(output)
+            if output is not None:
+                self.event_log.plan(self.game, conv.character.get_name(), old_plan, conv.character.get_heard()[heard_before:])
+
         if not selected_room:
             selected_room = self.game.player.get_current_place()
 
         self.game.advance(selected_room)
+        self.event_log.advance(self.game, selected_room)
+        self.wasted_prefetches = 0
+        self.greeted.clear()
 
         print(f"Moving to room {selected_room}!")
-        # TODO
-        self.update_people_in_all_rooms()
         self.phase_clock.set_time(self.game.get_time())
+        self.is_waiting = False
 
     # This function is called every time "submit prompt" button is pressed
     def on_prompt_submit(self, input_field: TextInput):
@@ -137,16 +340,23 @@ class GameWindow(IWindow):
         # Check if we are in the same room
         if self.game.characters[talking_to].get_current_place() != self.game.player.get_current_place():
             return
-        if talking_to not in self.conversations:
-            self.conversations[talking_to] = Conversation(self.game.player, self.game.characters[talking_to], self.game.game_phase)
+        if self.prefetching == talking_to:
+            # the greeting would arrive after the player's message
+            self.cancel_prefetch()
+        self.greeted.add(talking_to)
+        # also brings the session up to date with what happened since it was prepared (a kill in the same phase)
+        self.conversations[talking_to] = self.sessions.get(self.game.player, self.game.characters[talking_to], self.game.game_phase)
 
         self.add_speech_to_queue(PLAYER_NAME, message)
 
-        self.get_llm_response_async(
-            self.conversations[talking_to],
-            message,
-            callback=lambda response: self.add_speech_to_queue(talking_to, response.text)
-        )
+        if STREAM_RESPONSES:
+            self.stream_llm_response_async(self.conversations[talking_to], message, talking_to)
+        else:
+            self.get_llm_response_async(
+                self.conversations[talking_to],
+                message,
+                callback=lambda response: self.add_speech_to_queue(talking_to, response.text)
+            )
         input_field.clear()
 
     def on_kill(self):
@@ -155,6 +365,7 @@ class GameWindow(IWindow):
             player = self.game.get_characters()[PLAYER_NAME]
             if character.get_current_place() == player.get_current_place():
                 self.game.kill_character(character)
+                self.event_log.kill(self.game, character.get_name())
                 print(f"{character.get_name()} alive: {character.is_alive()}")
 
         self.set_clicked_character("")
@@ -171,17 +382,25 @@ class GameWindow(IWindow):
         self.update_people_in_all_rooms()
 
     def draw_all(self):
-        for room in self.rooms:
-            room.draw(self.screen, self.active_clicked_room == room.room_name)
-
         mouse_pos = pygame.mouse.get_pos()
-        # Draw rest of UI components
-        self.advance_button.draw(self.screen, mouse_pos)
-        self.prompt_input.draw(self.screen, mouse_pos)
-        self.submit_prompt.draw(self.screen, mouse_pos)
-        self.phase_clock.draw(self.screen)
-        self.kill_button.draw(self.screen, mouse_pos)
-        self.character_selection_text.draw(self.screen)
+        for room in self.rooms:
+            highlight = self.active_clicked_room == room.room_name
+            self.renderer.add(f"room {room.room_name}", room.get_rect(), room.is_dirty(highlight),
+                              lambda room=room, highlight=highlight: room.draw(self.screen, highlight))
+
+        # Rest of UI components, only the ones that changed are redrawn
+        self.renderer.add("advance", self.advance_button.get_rect(), self.advance_button.is_dirty(mouse_pos),
+                          lambda: self.advance_button.draw(self.screen, mouse_pos))
+        self.renderer.add("prompt", self.prompt_input.get_rect(), self.prompt_input.is_dirty(mouse_pos),
+                          lambda: self.prompt_input.draw(self.screen, mouse_pos))
+        self.renderer.add("submit", self.submit_prompt.get_rect(), self.submit_prompt.is_dirty(mouse_pos),
+                          lambda: self.submit_prompt.draw(self.screen, mouse_pos))
+        self.renderer.add("clock", self.phase_clock.get_rect(), self.phase_clock.is_dirty(),
+                          lambda: self.phase_clock.draw(self.screen))
+        self.renderer.add("kill", self.kill_button.get_rect(), self.kill_button.is_dirty(mouse_pos),
+                          lambda: self.kill_button.draw(self.screen, mouse_pos))
+        self.renderer.add("selection", self.character_selection_text.get_rect(), self.character_selection_text.is_dirty(),
+                          lambda: self.character_selection_text.draw(self.screen))
 
         debugtext = ""
         for c,k in self.game.characters.items():
@@ -190,17 +409,64 @@ class GameWindow(IWindow):
         #self.debug.set_text(debugtext)
         #self.debug.draw(self.screen)
 
-        if (self.active_speech != None):
-            self.active_speech.draw(self.screen)
-
-        pygame.display.flip()
+        self.add_overlay_layers()
+        self.add_speech_layer()
+        with profiler.section("flush"):
+            self.renderer.flush()
 
     def set_clicked_character(self, clicked_character):
+        if clicked_character != self.active_clicked_character:
+            self.prefetch(clicked_character)
         self.active_clicked_character = clicked_character
         self.character_selection_text.set_text(f"Selected character: {self.active_clicked_character}")
         self.kill_button.text_area.set_text(f"Kill {self.active_clicked_character}")
         self.submit_prompt.text_area.set_text(f"Send message to {self.active_clicked_character}")
 
+    def prefetch(self, name: str):
+        """
+        Prepare the session with a villager the player can talk to and let them greet the player,
+        so the first answer is there before the player has typed anything
+        """
+        self.cancel_prefetch()
+        character = self.game.characters.get(name)
+        if (character is None or character is self.game.player or not character.is_alive()
+                or character.get_current_place() != self.game.player.get_current_place()):
+            return
+        session = self.sessions.get(self.game.player, character, self.game.game_phase)
+        if (not PREFETCH_OPENERS or name in self.greeted or name in self.conversations
+                or self.wasted_prefetches >= MAX_WASTED_PREFETCHES):
+            return
+
+        self.prefetching = name
+        started = time.perf_counter()
+
+        def on_opener(response):
+            self.prefetching = None
+            if not response.text:
+                return
+            self.greeted.add(name)
+            if self.prompt_input.focused or self.prompt_input.get_text():
+                # the bubble would take the keys the player is typing, the greeting is not needed anymore
+                self.wasted_prefetches += 1
+                return
+            session.commit_opener(response.text)
+            self.event_log.llm(self.game, name, "(greeting)", response.text, time.perf_counter() - started)
+            self.add_speech_to_queue(name, response.text)
+
+        def on_error(error: Exception):
+            self.prefetching = None
+            self.wasted_prefetches += 1
+
+        self.llm.submit(session.prefetch_opener, owner=self.prefetch_owner, callback=on_opener, on_error=on_error,
+                        priority=SPECULATIVE)
+
+    def cancel_prefetch(self):
+        # a cancelled greeting is only sent if it already had its turn at the rate limit, count it as wasted anyway
+        if self.prefetching is not None:
+            self.llm.cancel(self.prefetch_owner)
+            self.prefetching = None
+            self.wasted_prefetches += 1
+
     def handle_standard_events(self, event):
         # Change active room and character selection
         for room in self.rooms:
@@ -218,20 +484,32 @@ class GameWindow(IWindow):
         self.submit_prompt.handle_event(event, self.prompt_input)
         self.kill_button.handle_event(event)
 
+    def close(self):
+        self.cancel_prefetch()
+        IWindow.close(self)
+
     def get_next_window(self):
         if self.game.game_phase >= STATES:
             if (self.target_character.is_alive()):
                 new_game = GameWindow(self.screen, f"{self.target_character.get_name()} is still alive. You lost the game!")
                 return new_game
             else:
-                return DetectiveWindow(self.screen, self.game)
+                return DetectiveWindow(self.screen, self.game, self.sessions)
         else:
             return None
 
+class InterrogationClosed(Exception):
+    """
+    The detective window was closed while the player was being interrogated
+    """
+
+
 class DetectiveWindow(IWindow):
 
-    def __init__(self, screen: pygame.Surface, game: Game):
+    def __init__(self, screen: pygame.Surface, game: Game, sessions: SessionPool | None = None):
         IWindow.__init__(self, screen)
+        # suspects continue the chat sessions they had during the game
+        self.sessions = sessions or SessionPool()
         self.finished = False
         self.end_game = False
         self.game = game
@@ -240,39 +518,66 @@ class DetectiveWindow(IWindow):
         self.submit_prompt = Button(window_pos=(500, 500), size=(280,50), text="Submit", on_click_function=self.on_prompt_submit)
         self.end_game_button = Button(window_pos=(500, 600), size=(280, 50), text="End game", on_click_function=self.on_game_end)
         
-        self.user_message = ""
+        # Answers typed by the player, handed to the interrogation thread. None means the window was closed.
+        self.user_messages: Queue[str | None] = Queue()
+        self.closed = False
         self.add_speech_to_queue(f"It's {self.game.get_time()}", "Times up!")
 
-        self.get_detective_async(
-            callback=lambda response, person: self.add_speech_to_queue(person, response)
-        )
+        self.get_detective_async(callback=self.show_detective_line)
+
+    def show_detective_line(self, response: str, person: str):
+        self.event_log.log("detective", self.game, speaker=person, text=response)
+        self.add_speech_to_queue(person, response)
 
     def get_detective_async(self, callback):
+        """
+        Every NPC suspect is interrogated by its own DetectiveConversation at the same time, the lines are
+        queued and shown in suspect order while the player reads. Only the player's own interrogation waits for input.
+        """
+        victim = " and ".join(self.game.killed_people())
+        detective_char = Character("Detective")
+        suspects = self.game.alive_people()
+        random.shuffle(suspects)
+
+        transcripts = {suspect.get_name(): [] for suspect in suspects}
+        lines = {suspect.get_name(): Queue() for suspect in suspects}
+        npc_suspects = [suspect for suspect in suspects if suspect.get_name() != PLAYER_NAME]
+        self.interrogations = ThreadPoolExecutor(max_workers=max(1, len(npc_suspects)), thread_name_prefix="interrogation")
+        for suspect in npc_suspects:
+            self.interrogations.submit(self.interrogate, suspect, victim, detective_char,
+                                       transcripts[suspect.get_name()], lines[suspect.get_name()].put)
+
+        def show(line):
+            if line is not None:
+                callback(*line)
+
         def worker():
             self.is_waiting = True # lock mutex
-            detective = DetectiveConversation(None, " and ".join(self.game.killed_people()))
-            detective_char = Character("Detective")
-            suspects = self.game.alive_people()
-            random.shuffle(suspects)
             for suspect in suspects:
-                sus_conversation = Conversation(detective_char, suspect, STATES)
-                sus_conversation.send_message(f"""{detective.victim} has been killed by someone in this village. 
-                                              A detective has come to find out who did it and will interrogate each town member. 
-                                              Now it's your turn to answer the questions he asks you.""")
-                question = detective.change_character(suspect)
-                while detective.question_limit >= 0 and "i am done here" not in question.text.lower():
-                    callback(question.text, f"{detective_char.get_name()} question #{detective.question_limit}")
-                    response_text = ""
-                    if suspect.get_name() == PLAYER_NAME:
-                        response_text = self.wait_for_user_input()
-                    else:
-                        response = sus_conversation.send_message(question.text)
-                        response_text = response.text
-                    callback(response_text, f"{suspect.get_name()}")
-                    question = detective.send_message(response_text)
-
-            final_response = detective.end_conversation()
-            final_message = f"{final_response.suspect} did it. Reasoning: {final_response.explanation}"
+                if self.closed:
+                    return
+                name = suspect.get_name()
+                if name == PLAYER_NAME:
+                    self.interrogate(suspect, victim, detective_char, transcripts[name], show)
+                    continue
+                # lines of this suspect were generated in the background, show them as they come
+                while (line := lines[name].get()) is not None:
+                    show(line)
+            if self.closed:
+                return
+
+            detective = DetectiveConversation(None, victim)
+            try:
+                self.llm.call(detective.review_interrogations, transcripts, priority=DETECTIVE)
+                final_response = self.llm.call(detective.end_conversation, priority=DETECTIVE)
+            except Exception as error:
+                print(f"Detective verdict failed: {error!r}")
+                final_response = None
+            # the game must still be able to end without a verdict
+            if final_response is None:
+                final_message = "I could not figure out who did it. The murderer got away this time."
+            else:
+                final_message = f"{final_response.suspect} did it. Reasoning: {final_response.explanation}"
             callback(final_message, f"{detective_char.get_name()} solution")
             self.is_waiting = False
             self.finished = True
@@ -280,36 +585,90 @@ class DetectiveWindow(IWindow):
         thread.daemon = True
         thread.start()
 
-    def wait_for_user_input(self) -> str:
+    def interrogate(self, suspect: Character, victim: str, detective_char: Character, transcript: list, emit):
+        """
+        Run the questions and answers with one suspect. emit((text, speaker)) is called for every line to show,
+        and with None once the interrogation is over.
+        """
+        try:
+            detective = DetectiveConversation(suspect, victim)
+            sus_conversation = None
+            if suspect.get_name() != PLAYER_NAME:
+                sus_conversation = self.sessions.get(detective_char, suspect, STATES)
+                self.llm.call(sus_conversation.send_message, f"""{victim} has been killed by someone in this village. 
+                                              A detective has come to find out who did it and will interrogate each town member. 
+                                              Now it's your turn to answer the questions he asks you.""", PRIMING, priority=DETECTIVE)
+            question = self.llm.call(detective.change_character, suspect, priority=DETECTIVE)
+            while not self.closed and detective.question_limit >= 0 and "i am done here" not in question.text.lower():
+                emit((question.text, f"{detective_char.get_name()} question #{detective.question_limit}"))
+                transcript.append((detective_char.get_name(), question.text))
+                if sus_conversation is None:
+                    response_text = self.wait_for_user_input()
+                else:
+                    response_text = self.llm.call(sus_conversation.send_message, question.text, DETECTIVE_KIND, priority=DETECTIVE).text
+                emit((response_text, f"{suspect.get_name()}"))
+                transcript.append((suspect.get_name(), response_text))
+                question = self.llm.call(detective.send_message, response_text, priority=DETECTIVE)
+        except InterrogationClosed:
+            pass
+        except Exception as error:
+            print(f"Interrogation of {suspect.get_name()} failed: {error!r}")
+        finally:
+            emit(None)
+
+    def wait_for_user_input(self, timeout: float = PLAYER_ANSWER_TIMEOUT) -> str:
+        """
+        Block the interrogation thread until the player submits an answer to the question just asked
+        """
+        # answers submitted before this question (e.g. late for the previous one) do not answer it
+        while True:
+            try:
+                message = self.user_messages.get_nowait()
+            except Empty:
+                break
+            if message is None:
+                raise InterrogationClosed()
         self.is_waiting = False
-        while not self.user_message:
-            sleep(0.2)
-        to_be_returned = self.user_message
-        self.user_message = ""
+        try:
+            message = self.user_messages.get(timeout=timeout)
+        except Empty:
+            message = "(no answer)"
         self.is_waiting = True
-        return to_be_returned
+        if message is None:
+            raise InterrogationClosed()
+        return message
 
     def on_prompt_submit(self, input_field: TextInput):
         message = input_field.get_text()
         if message:
-            self.user_message = message
+            self.user_messages.put(message)
         input_field.clear()
 
+    def close(self):
+        self.closed = True
+        # wake up an interrogation waiting for the player, and drop the ones that did not start
+        self.user_messages.put(None)
+        self.interrogations.shutdown(wait=False, cancel_futures=True)
+        IWindow.close(self)
+
     def on_game_end(self):
         self.end_game = True
 
     def draw_all(self):
         mouse_pos = pygame.mouse.get_pos()
-        self.prompt_input.draw(self.screen, mouse_pos)
-        self.submit_prompt.draw(self.screen, mouse_pos)
+        self.renderer.add("prompt", self.prompt_input.get_rect(), self.prompt_input.is_dirty(mouse_pos),
+                          lambda: self.prompt_input.draw(self.screen, mouse_pos))
+        self.renderer.add("submit", self.submit_prompt.get_rect(), self.submit_prompt.is_dirty(mouse_pos),
+                          lambda: self.submit_prompt.draw(self.screen, mouse_pos))
 
         if (self.finished):
-            self.end_game_button.draw(self.screen, mouse_pos)
-
-        if (self.active_speech != None):
-            self.active_speech.draw(self.screen)
+            self.renderer.add("end game", self.end_game_button.get_rect(), self.end_game_button.is_dirty(mouse_pos),
+                              lambda: self.end_game_button.draw(self.screen, mouse_pos))
 
-        pygame.display.flip()
+        self.add_overlay_layers()
+        self.add_speech_layer()
+        with profiler.section("flush"):
+            self.renderer.flush()
 
     def handle_standard_events(self, event):
         self.prompt_input.handle_event(event, self.prompt_input)
@@ -324,12 +683,42 @@ class DetectiveWindow(IWindow):
             return None
 
 # ================ MAIN FUNC ==================
-pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Epic murder mystery game")
-
-window = GameWindow(screen)
-while window:
-    window = window.main_loop()
-sys.exit()
+if __name__ == "__main__":
+    if STARTUP_DIAGNOSTICS:
+        startup_diagnostics.mark("imports done")
+    parser = argparse.ArgumentParser(description="Epic murder mystery game")
+    parser.add_argument("--startup-diagnostics", action="store_true", help="print the time to the first frame and the slowest imports")
+    parser.add_argument("--event-log", metavar="PATH", help="append everything that happens in the games to this JSONL file")
+    parser.add_argument("--replay", metavar="PATH", help="continue the last game of an event log")
+    parser.add_argument("--replay-phase", type=int, help="with --replay, restore the game as it was in this phase")
+    parser.add_argument("--profile-frames", metavar="PATH", help="time every frame and component draw, show them with F4 and write a folded flamegraph trace to this file on exit")
+    parser.add_argument("--llm-metrics", metavar="PATH", help="write LLM latency and token usage to this file on exit (.prom for Prometheus text, JSON otherwise)")
+    args = parser.parse_args()
+    if args.event_log:
+        event_log = EventLog(args.event_log)
+    if args.profile_frames:
+        profiler.start()
+    # Game debug output (who saw whom) is printed while playing
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("game").setLevel(logging.DEBUG)
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Epic murder mystery game")
+
+    if args.replay:
+        restored = replay(args.replay, args.replay_phase)
+        window = GameWindow(screen, f"Game restored at {restored.get_time()}. (Press any key to continue.)", restored)
+    else:
+        window = GameWindow(screen)
+    # LLM client and schemas are created while the player reads the info bubble
+    warm_up()
+    if STARTUP_DIAGNOSTICS:
+        startup_diagnostics.mark("window created")
+    while window:
+        window = window.main_loop()
+    if args.llm_metrics:
+        llm_metrics.dump(args.llm_metrics)
+    if args.profile_frames:
+        profiler.dump_folded(args.profile_frames)
+    sys.exit()
 # =============================================
\ No newline at end of file
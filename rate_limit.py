@@ -0,0 +1,220 @@
+"""
+Client-side rate limiting and retries for LLM requests, shared by every thread.
+Requests take a token from a token bucket. When there are not enough tokens, waiting requests go in priority order.
+429 and 5xx errors are retried with jittered exponential backoff, and a 429 pauses the whole bucket.
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Requests per minute allowed by the quota (0 = no limit, the default for the offline backend)
+# and how many may be sent at once after a quiet period
+REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "0" if os.environ.get("LLM_BACKEND") == "offline" else "60"))
+BURST = int(os.environ.get("LLM_BURST", "10"))
+MAX_RETRIES = 4
+# Backoff before retry n is about RETRY_BASE_DELAY * 2^n seconds (0.5x - 1.5x), at most RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Request priorities, lower goes first
+INTERACTIVE = 0
+DETECTIVE = 1
+BACKGROUND = 2
+SPECULATIVE = 3
+# Tokens speculative requests leave in the bucket, so a player message never waits for them
+SPECULATIVE_RESERVE = 1
+# Seconds between checks for cancellation while waiting for a token
+CANCEL_POLL_INTERVAL = 0.1
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=BACKGROUND)
+_cancel: contextvars.ContextVar[threading.Event | None] = contextvars.ContextVar("llm_cancel", default=None)
+
+
+class RequestCancelled(Exception):
+    """
+    The request was cancelled or timed out before it was sent
+    """
+
+
+@contextmanager
+def priority(level: int):
+    """
+    Requests made in this block (in this thread or task) have this priority
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextmanager
+def cancel_on(event: threading.Event | None):
+    """
+    Requests made in this block give up (raise RequestCancelled) instead of waiting or retrying once event is set
+    """
+    token = _cancel.set(event)
+    try:
+        yield
+    finally:
+        _cancel.reset(token)
+
+
+def _check(cancel: threading.Event | None):
+    if cancel is not None and cancel.is_set():
+        raise RequestCancelled()
+
+
+class RateLimiter:
+    """
+    Token bucket that hands out tokens to the highest priority waiting request first
+    """
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, burst: int = BURST):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # set by pause(), no tokens are handed out before this time
+        self.paused_until = 0.0
+        self._waiting: list[tuple[int, int]] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, level: int | None = None, cancel: threading.Event | None = None):
+        """
+        Block until this request may be sent. Raises RequestCancelled if cancel is set before that.
+        """
+        _check(cancel)
+        if self.rate <= 0:
+            return
+        level = current_priority() if level is None else level
+        needed = min(self.capacity, 1 + (SPECULATIVE_RESERVE if level >= SPECULATIVE else 0))
+        with self._condition:
+            ticket = (level, next(self._order))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    _check(cancel)
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiting[0] == ticket and self.tokens >= needed and now >= self.paused_until:
+                        heapq.heappop(self._waiting)
+                        self.tokens -= 1
+                        return
+                    wait = max((needed - self.tokens) / self.rate, self.paused_until - now, 0.001)
+                    if cancel is not None:
+                        wait = min(wait, CANCEL_POLL_INTERVAL)
+                    self._condition.wait(wait)
+            finally:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                # the next request in line may go now
+                self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """
+        The server said the quota is used up, send nothing for a while
+        """
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+def error_status(error: Exception) -> int | None:
+    """
+    HTTP status of an API error (google.genai errors have it in code), None for other errors
+    """
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    status = error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    # connection problems (httpx errors are not OSErrors)
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__module__.startswith("httpx")
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    # Gemini tells how long to wait on 429 in the error details ("retryDelay": "23s")
+    match = re.search(r"retryDelay'?\"?:\s*'?\"?(\d+(?:\.\d+)?)s", str(getattr(error, "details", "")))
+    if match:
+        return float(match.group(1))
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _backoff(limiter: RateLimiter, error: Exception, attempt: int, cancel: threading.Event | None):
+    delay = retry_delay(error, attempt)
+    if error_status(error) == 429:
+        limiter.pause(delay)
+    if cancel is None:
+        time.sleep(delay)
+    elif cancel.wait(delay):
+        raise RequestCancelled() from error
+
+
+def call(fn, *args, limiter: RateLimiter | None = None, cancel: threading.Event | None = None):
+    """
+    fn(*args) within the rate limit, retried on rate limit and server errors.
+    Gives up with RequestCancelled once cancel (by default the one set with cancel_on) is set.
+    """
+    limiter = limiter or get_limiter()
+    cancel = cancel or _cancel.get()
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(cancel=cancel)
+        try:
+            return fn(*args)
+        except Exception as error:
+            if attempt == MAX_RETRIES or not is_retryable(error):
+                raise
+            _backoff(limiter, error, attempt, cancel)
+
+
+def stream(fn, *args, limiter: RateLimiter | None = None, cancel: threading.Event | None = None):
+    """
+    Same as call for a function returning an iterator of chunks. Only retried until the first chunk arrives,
+    after that the chunks are already shown to the player.
+    """
+    limiter = limiter or get_limiter()
+    cancel = cancel or _cancel.get()
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(cancel=cancel)
+        try:
+            chunks = iter(fn(*args))
+            first = next(chunks, None)
+            break
+        except Exception as error:
+            if attempt == MAX_RETRIES or not is_retryable(error):
+                raise
+            _backoff(limiter, error, attempt, cancel)
+    if first is not None:
+        yield first
+        yield from chunks
+
+
+_limiter: RateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,253 @@
+"""
+Headless simulation of the game without the UI or the LLM, used to tune PLACES/STATES balance.
+Villagers follow their random plans, the player follows a scripted policy and kills the target
+as soon as they are in the same place (unless --no-kill). Being in the same place as the target is
+counted in every phase, also after the kill, so reachability does not depend on the kill.
+
+    python simulation.py --games 100000 --seed 1 --policy chase
+    python simulation.py --games 100000 --workers 0 --sweep-villagers 3,6,12 --sweep-places 3,4 --sweep-states 4,6
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from game import Game, PLACES, PLAYER_NAME, PLAYER_NAMES, STATES
+
+POLICIES = ["random", "chase", "stay"]
+# "object" is game.Game, "array" the NumPy-backed game_array.ArrayGame for big towns
+ENGINES = ["object", "array"]
+# Games per task sent to a worker process
+CHUNK_SIZE = 2000
+
+
+def make_names(count: int) -> list[str]:
+    """
+    Villager names for a town of count villagers, the real names first
+    """
+    return PLAYER_NAMES[:count] + [f"Villager{i}" for i in range(len(PLAYER_NAMES), count)]
+
+
+def make_places(count: int) -> list[str]:
+    return PLACES[:count] + [f"Place{i}" for i in range(len(PLACES), count)]
+
+
+def game_class(engine: str):
+    if engine == "array":
+        # numpy is only needed for this engine
+        from game_array import ArrayGame
+        return ArrayGame
+    return Game
+
+
+def game_seed(seed: int, index: int) -> int:
+    # Every game has its own seed, so results do not depend on how the games are split up.
+    # The index takes the low 32 bits, so no two (seed, index) pairs share a game seed.
+    return (seed << 32) | index
+
+
+class SimStats:
+    """
+    Aggregate statistics of many simulated games. Only holds counters, so stats of separate runs can be merged.
+    """
+
+    def __init__(self, states: int = STATES):
+        self.states = states
+        self.games = 0
+        # games where the player and the target (alive or not) were in the same place at least once
+        self.reachable = 0
+        self.kills = 0
+        # number of witnesses -> number of kills with that many witnesses
+        self.witnesses: dict[int, int] = {}
+        # per phase: games where the player was with the target, and the sum of other villagers with the player
+        self.colocated = [0] * states
+        self.company = [0] * states
+
+    def merge(self, other: "SimStats"):
+        self.games += other.games
+        self.reachable += other.reachable
+        self.kills += other.kills
+        for count, kills in other.witnesses.items():
+            self.witnesses[count] = self.witnesses.get(count, 0) + kills
+        self.colocated = [a + b for a, b in zip(self.colocated, other.colocated)]
+        self.company = [a + b for a, b in zip(self.company, other.company)]
+
+    def as_dict(self) -> dict:
+        games = max(1, self.games)
+        kills = max(1, self.kills)
+        return {
+            "games": self.games,
+            "target_reachable_rate": self.reachable / games,
+            "kill_rate": self.kills / games,
+            "unwitnessed_kill_rate": self.witnesses.get(0, 0) / kills,
+            "mean_witnesses": sum(count * n for count, n in self.witnesses.items()) / kills,
+            "witness_histogram": dict(sorted(self.witnesses.items())),
+            "colocation_rate_per_phase": [n / games for n in self.colocated],
+            "mean_company_per_phase": [n / games for n in self.company],
+        }
+
+
+def choose_move(policy: str, game: Game, target, rng: random.Random) -> str:
+    player = game.get_player()
+    if policy == "chase" and target.is_alive():
+        # follow the target to where it is planning to go next
+        return target.get_plans()[0] if target.get_plans() else target.get_current_place()
+    if policy == "stay":
+        return player.get_current_place()
+    return rng.choice(game.places)
+
+
+def play_game(seed: int, names: list[str], places: list[str], states: int, policy: str, stats: SimStats, engine: str = "object",
+              kill: bool = True):
+    """
+    Simulate one game and add its results to stats. With kill False the player only follows the policy.
+    """
+    rng = random.Random(seed)
+    game = game_class(engine)(names, places, states, rng)
+    player = game.get_player()
+    target = rng.choice([c for c in game.get_characters().values() if c is not player])
+
+    reachable = False
+    while game.game_phase < states:
+        phase = game.game_phase
+        place = player.get_current_place()
+        people = game.people_in_room(place)
+        stats.company[phase] += sum(1 for c in people if c is not player and c.is_alive())
+
+        if target.get_current_place() == place:
+            reachable = True
+            stats.colocated[phase] += 1
+
+        if kill and target.is_alive() and target.get_current_place() == place:
+            witnesses = sum(1 for c in people if c is not player and c is not target and c.is_alive())
+            game.kill_character(target)
+            stats.kills += 1
+            stats.witnesses[witnesses] = stats.witnesses.get(witnesses, 0) + 1
+
+        game.advance(choose_move(policy, game, target, rng))
+
+    stats.games += 1
+    stats.reachable += reachable
+
+
+def run(games: int, seed: int = 0, villagers: int = len(PLAYER_NAMES), places: int = len(PLACES),
+        states: int = STATES, policy: str = "random", first_game: int = 0, engine: str = "object", kill: bool = True) -> SimStats:
+    """
+    Simulate games number first_game .. first_game + games - 1 of the run with this seed
+    """
+    names = make_names(villagers)
+    place_names = make_places(places)
+    stats = SimStats(states)
+    for index in range(first_game, first_game + games):
+        play_game(game_seed(seed, index), names, place_names, states, policy, stats, engine, kill)
+    return stats
+
+
+def _run_chunk(task: tuple) -> SimStats:
+    # Runs in a worker process, only the counters are sent back
+    first_game, games, seed, villagers, places, states, policy, engine, kill = task
+    return run(games, seed, villagers, places, states, policy, first_game, engine, kill)
+
+
+def sweep(configs: list[tuple[int, int, int]], games: int, seed: int = 0, policy: str = "random",
+          workers: int | None = None, chunk_size: int = CHUNK_SIZE, engine: str = "object", kill: bool = True) -> list[SimStats]:
+    """
+    Run games for every (villagers, places, states) config, split into chunks over a process pool.
+    Every game is seeded from seed and its index, so the results are the same for any number of workers.
+    workers=None uses every core, workers=1 runs everything in this process.
+    """
+    tasks = []
+    for config_index, (villagers, places, states) in enumerate(configs):
+        for first_game in range(0, games, chunk_size):
+            tasks.append((config_index, (first_game, min(chunk_size, games - first_game), seed, villagers, places, states, policy, engine, kill)))
+
+    results = [SimStats(states) for _, _, states in configs]
+    if workers == 1:
+        for config_index, task in tasks:
+            results[config_index].merge(_run_chunk(task))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunk_stats = pool.map(_run_chunk, [task for _, task in tasks])
+        for (config_index, _), stats in zip(tasks, chunk_stats):
+            results[config_index].merge(stats)
+    return results
+
+
+def run_parallel(games: int, seed: int = 0, villagers: int = len(PLAYER_NAMES), places: int = len(PLACES),
+                 states: int = STATES, policy: str = "random", workers: int | None = None, engine: str = "object",
+                 kill: bool = True) -> SimStats:
+    return sweep([(villagers, places, states)], games, seed, policy, workers, engine=engine, kill=kill)[0]
+
+
+def parse_counts(text: str | None, default: int) -> list[int]:
+    if not text:
+        return [default]
+    return [int(count) for count in text.split(",")]
+
+
+def print_sweep(configs: list[tuple[int, int, int]], results: list[SimStats], elapsed: float):
+    total_games = sum(stats.games for stats in results)
+    print(f"{total_games} games in {elapsed:.2f} s ({total_games / max(elapsed, 1e-9):.0f} games/s)")
+    print("Villagers  Places  States  Reachable   Kills  Unwitnessed  Mean witnesses")
+    for (villagers, places, states), stats in zip(configs, results):
+        report = stats.as_dict()
+        print(f"{villagers:9}  {places:6}  {states:6}  {report['target_reachable_rate']:9.1%}  {report['kill_rate']:6.1%}"
+              f"  {report['unwitnessed_kill_rate']:11.1%}  {report['mean_witnesses']:14.2f}")
+
+
+def print_report(stats: SimStats, elapsed: float):
+    report = stats.as_dict()
+    print(f"{report['games']} games in {elapsed:.2f} s ({report['games'] / max(elapsed, 1e-9):.0f} games/s)")
+    print(f"Target reachable: {report['target_reachable_rate']:.1%}")
+    print(f"Kills: {report['kill_rate']:.1%}, unwitnessed: {report['unwitnessed_kill_rate']:.1%}, mean witnesses: {report['mean_witnesses']:.2f}")
+    print(f"Witness histogram: {report['witness_histogram']}")
+    print("Phase  with target  others with player")
+    for phase, (colocated, company) in enumerate(zip(report["colocation_rate_per_phase"], report["mean_company_per_phase"])):
+        print(f"{phase:5}  {colocated:11.1%}  {company:18.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run seeded headless games and report balance statistics")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--villagers", type=int, default=len(PLAYER_NAMES), help=f"number of villagers besides {PLAYER_NAME}")
+    parser.add_argument("--places", type=int, default=len(PLACES))
+    parser.add_argument("--states", type=int, default=STATES)
+    parser.add_argument("--policy", choices=POLICIES, default="random")
+    parser.add_argument("--engine", choices=ENGINES, default="object", help="array is faster for towns of hundreds of villagers")
+    parser.add_argument("--no-kill", action="store_true", help="never kill the target, to measure how often it can be reached")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 = one per core")
+    parser.add_argument("--sweep-villagers", help="comma separated villager counts to sweep over")
+    parser.add_argument("--sweep-places", help="comma separated place counts to sweep over")
+    parser.add_argument("--sweep-states", help="comma separated game lengths to sweep over")
+    parser.add_argument("--json", action="store_true", help="print the statistics as JSON")
+    parser.add_argument("--log-level", default="WARNING", help="e.g. DEBUG to see what every character saw")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(message)s", level=args.log_level.upper())
+
+    workers = args.workers or os.cpu_count()
+    configs = list(itertools.product(parse_counts(args.sweep_villagers, args.villagers),
+                                     parse_counts(args.sweep_places, args.places),
+                                     parse_counts(args.sweep_states, args.states)))
+
+    start = time.perf_counter()
+    results = sweep(configs, args.games, args.seed, args.policy, workers, engine=args.engine, kill=not args.no_kill)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        reports = [{"villagers": villagers, "places": places, "states": states, **stats.as_dict()}
+                   for (villagers, places, states), stats in zip(configs, results)]
+        print(json.dumps(reports[0] if len(reports) == 1 else reports, indent=2))
+    elif len(results) == 1:
+        print_report(results[0], elapsed)
+    else:
+        print_sweep(configs, results, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import builtins
+import sys
+import threading
+import time
+
+# How many of the slowest imports report() lists
+TOP_IMPORTS = 15
+
+_start = time.perf_counter()
+_original_import = builtins.__import__
+# module name -> [self time, cumulative time], like the two columns of python -X importtime
+_import_times: dict[str, list[float]] = {}
+# child times of the imports in progress, only the main thread is timed
+_import_stack: list[list[float]] = []
+_main_thread = threading.main_thread().ident
+_milestones: list[tuple[str, float]] = []
+_reported = False
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Only the first import of a module costs anything, the rest are dict lookups.
+    # Imports in other threads (e.g. warm_up) run at the same time and would mix into the stack.
+    if level != 0 or name in sys.modules or threading.get_ident() != _main_thread:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    child_time = [0.0]
+    _import_stack.append(child_time)
+    began = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - began
+        _import_stack.pop()
+        if _import_stack:
+            _import_stack[-1][0] += elapsed
+        _import_times[name] = [elapsed - child_time[0], elapsed]
+
+
+def install():
+    """
+    Start recording import times. Must be called before the imports that should be measured.
+    """
+    global _start
+    _start = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def mark(label: str):
+    """
+    Record a startup milestone (seconds since install)
+    """
+    _milestones.append((label, time.perf_counter() - _start))
+
+
+def first_frame():
+    """
+    Called after every frame, prints the report after the first one
+    """
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    mark("first frame")
+    builtins.__import__ = _original_import
+    report()
+
+
+def report():
+    print("=== Startup diagnostics ===")
+    for label, at in _milestones:
+        print(f"{at * 1000:9.1f} ms  {label}")
+
+    print(f"Slowest imports (self / cumulative ms), {len(_import_times)} modules imported:")
+    slowest = sorted(_import_times.items(), key=lambda item: item[1][1], reverse=True)[:TOP_IMPORTS]
+    for name, (self_time, cumulative) in slowest:
+        print(f"{self_time * 1000:9.1f} | {cumulative * 1000:9.1f} | {name}")
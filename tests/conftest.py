@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules live in the repository root, and pygame must not open a real window
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
@@ -0,0 +1,59 @@
+import random
+from event_log import EventLog, read_sessions, replay
+from game import HEARD, PLAYER_NAME, STATES, Game, Observation
+
+
+def play(path: str, seed: int) -> dict[int, dict]:
+    """
+    Play a seeded game, logging it like GameWindow does. Returns the snapshot at the end of every phase.
+    """
+    rng = random.Random(seed)
+    game = Game(rng=rng)
+    game.target = rng.choice([name for name in game.characters if name != PLAYER_NAME])
+    log = EventLog(path)
+    log.start(game)
+    snapshots = {}
+    for _ in range(STATES):
+        player = game.get_player()
+        # a chat with someone in the same place, which changes their plan
+        people = [c for c in game.people_in_room(player.get_current_place()) if c is not player and c.is_alive()]
+        if people:
+            character = rng.choice(people)
+            place = rng.choice(game.places)
+            message = f"Meet me in the {place}"
+            log.llm(game, character.get_name(), message, "Sure!", 0.5, 0.1)
+            old_plan = list(character.get_plans())
+            heard_before = len(character.get_heard())
+            if character.plan:
+                character.plan[0] = place
+            character.add_heard(Observation(HEARD, (PLAYER_NAME,), player.get_current_place(), game.game_phase, message))
+            log.plan(game, character.get_name(), old_plan, character.get_heard()[heard_before:])
+            if rng.random() < 0.3:
+                game.kill_character(character)
+                log.kill(game, character.get_name())
+        snapshots[game.game_phase] = game.snapshot()
+
+        move = rng.choice(game.places)
+        game.advance(move)
+        log.advance(game, move)
+    snapshots[game.game_phase] = game.snapshot()
+    log._file.close()
+    return snapshots
+
+
+def test_replay_restores_every_phase(tmp_path):
+    for seed in range(5):
+        # sessions started in the same millisecond would share a number, so one log per game
+        path = str(tmp_path / f"session{seed}.jsonl")
+        snapshots = play(path, seed)
+        assert replay(path).snapshot() == snapshots[STATES]
+        for phase, snapshot in snapshots.items():
+            assert replay(path, phase).snapshot() == snapshot, f"seed {seed}, phase {phase}"
+
+
+def test_chat_events_are_logged(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    play(path, 0)
+    events = read_sessions(path)[-1]
+    chats = [event for event in events if event["type"] == "llm"]
+    assert chats and all(event["response"] == "Sure!" and event["error"] is None for event in chats)
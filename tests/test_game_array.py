@@ -0,0 +1,61 @@
+import random
+import pytest
+from game import HEARD, PLACES, PLAYER_NAME, STATES, Game, Observation
+from simulation import make_names, make_places
+
+np = pytest.importorskip("numpy")
+from game_array import ArrayGame
+
+
+def make_games(seed: int, villagers: int, places: int) -> tuple[Game, ArrayGame]:
+    """
+    Game and ArrayGame of the same seed. The engines draw plans differently from the rng,
+    so the ArrayGame starts from the plans drawn by the Game.
+    """
+    names, place_names = make_names(villagers), make_places(places)
+    game = Game(names, place_names, STATES, random.Random(seed))
+    array_game = ArrayGame(names, place_names, STATES, random.Random(seed))
+    for i, c in enumerate(game.characters.values()):
+        array_game.plans[i, :STATES] = [array_game.place_id(place) for place in c.get_history() + c.get_plans()]
+    array_game.locations[:, 0] = array_game.plans[:, 0]
+    return game, array_game
+
+
+def villagers(game) -> dict:
+    """
+    History, observations and alive state of the alive villagers other than the player
+    """
+    return {c.get_name(): (c.get_history(), list(c.get_seen()), list(c.get_heard()), c.is_alive())
+            for c in game.alive_people() if c.get_name() != PLAYER_NAME}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_array_game_matches_game(seed):
+    game, array_game = make_games(seed, villagers=12, places=len(PLACES))
+    assert villagers(array_game) == villagers(game)
+    rng = random.Random(seed)
+    for _ in range(STATES):
+        # kill someone the player can reach, like the player would
+        victims = [c for c in game.people_in_room(game.get_player().get_current_place())
+                   if c.is_alive() and c.get_name() != PLAYER_NAME]
+        if victims and rng.random() < 0.3:
+            victim = rng.choice(victims).get_name()
+            game.kill_character(game.characters[victim])
+            array_game.kill_character(array_game.characters[victim])
+
+        # and rewrite a plan like Conversation.apply_final_output
+        planners = [c.get_name() for c in game.alive_people() if c.get_name() != PLAYER_NAME and c.get_plans()]
+        if planners:
+            name = rng.choice(planners)
+            place = rng.choice(game.places)
+            heard = Observation(HEARD, (PLAYER_NAME,), game.characters[name].get_current_place(), game.game_phase,
+                                f"Meet me in the {place}")
+            for g in (game, array_game):
+                g.characters[name].plan[0] = place
+                g.characters[name].add_heard(heard)
+
+        move = rng.choice(game.places)
+        game.advance(move)
+        array_game.advance(move)
+        assert villagers(array_game) == villagers(game), f"diverged at phase {game.game_phase}"
+        assert array_game.killed_people() == game.killed_people()
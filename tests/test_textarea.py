@@ -0,0 +1,72 @@
+import random
+import pygame
+import pytest
+from ui_textarea import TextArea
+
+TEXTS = [
+    "",
+    "Hello",
+    "Oh, hello there! Lovely weather today, isn't it?",
+    "Well, I was at the Tavern this morning, then I walked over to the Field because Bob said the harvest "
+    "needed extra hands.\nOn the way I saw Alice near the Forest  talking to someone I did not recognize. " * 5,
+    "Averyveryveryveryveryverylongwordthatdoesnotfitonanylineatallnomatterhowwidethetextareais short words after",
+]
+WIDTHS = [60, 200, 680]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def screen():
+    pygame.init()
+    yield pygame.display.set_mode((1280, 720))
+    pygame.quit()
+
+
+def wrap(text: str, font: pygame.font.Font, width: int) -> list[str]:
+    """
+    Word wrapping without any cache, as TextArea.draw did it before the layout cache
+    """
+    lines = []
+    current_line = ""
+    for word in text.split(None):
+        test_line = current_line + word + " "
+        if font.size(test_line)[0] < width - 10:
+            current_line = test_line
+        else:
+            lines.append(current_line)
+            current_line = word + " "
+    lines.append(current_line)
+    return lines
+
+
+def check(text_area: TextArea, screen: pygame.Surface):
+    text_area.draw(screen)
+    expected = wrap(text_area.text, text_area.font, text_area.size[0])
+    assert text_area._lines == expected
+    assert [surface.get_width() for surface in text_area._surfaces] == \
+           [text_area.font.size(line)[0] for line in expected]
+
+
+@pytest.mark.parametrize("width", WIDTHS)
+@pytest.mark.parametrize("text", TEXTS)
+def test_layout_matches_uncached_wrapping(screen, text, width):
+    check(TextArea((0, 0), (width, 300), text), screen)
+
+
+@pytest.mark.parametrize("width", WIDTHS)
+@pytest.mark.parametrize("text", TEXTS)
+def test_layout_follows_text_and_size_changes(screen, text, width):
+    rng = random.Random(width)
+    text_area = TextArea((0, 0), (width, 300), "")
+    # revealed letter by letter, like a speech bubble
+    for letter in text:
+        text_area.text += letter
+        check(text_area, screen)
+    # then edited and resized, like a text input
+    for _ in range(20):
+        if text_area.text and rng.random() < 0.3:
+            text_area.set_text(text_area.text[:rng.randrange(len(text_area.text))])
+        elif rng.random() < 0.2:
+            text_area.size = (rng.choice(WIDTHS), 300)
+        else:
+            text_area.text += rng.choice(["a", " ", "word ", "\n", "longer words here "])
+        check(text_area, screen)
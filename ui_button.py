@@ -14,13 +14,25 @@ class Button:
         self.size: tuple[int, int] = size
         self.on_click_function = on_click_function
         self.text_area = TextArea(window_pos, size, text)
+        self._drawn_hover: bool | None = None
+
+    def get_rect(self) -> pygame.Rect:
+        return pygame.Rect(*self.window_pos, *self.size).union(self.text_area.get_rect())
+
+    def is_dirty(self, mouse_pos: tuple[int, int]) -> bool:
+        """
+        True if hover state or text changed since the last draw
+        """
+        hovered = pygame.Rect(*self.window_pos, *self.size).collidepoint(mouse_pos)
+        return hovered != self._drawn_hover or self.text_area.is_dirty()
 
     def draw(self, screen: pygame.Surface, mouse_pos: tuple[int, int]):
         """
         Draw the button, using highlight color if hovered.
         """
         rect = pygame.Rect(*self.window_pos, *self.size)
-        if rect.collidepoint(mouse_pos):
+        self._drawn_hover = rect.collidepoint(mouse_pos)
+        if self._drawn_hover:
             pygame.draw.rect(screen, self.highlight_color, rect)
         else:
             pygame.draw.rect(screen, self.color, rect)
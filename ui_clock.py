@@ -16,6 +16,12 @@ class Clock:
         self.time = time
         self.text_area.set_text(f"Time is: {time}")
 
+    def get_rect(self) -> pygame.Rect:
+        return self.text_area.get_rect()
+
+    def is_dirty(self) -> bool:
+        return self.text_area.is_dirty()
+
     def draw(self, screen: pygame.Surface):
         # TODO render some clock sprite
         self.text_area.draw(screen)
\ No newline at end of file
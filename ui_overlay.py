@@ -0,0 +1,38 @@
+import pygame
+from ui_textarea import get_font
+
+
+class Overlay:
+    """
+    Box of debug text lines drawn on top of the window, e.g. the LLM metrics. Lines are not wrapped.
+    """
+    text_color: tuple[int, int, int] = (255, 255, 255)
+    bg_color: tuple[int, int, int] = (40, 40, 40)
+
+    def __init__(self, window_pos: tuple[int, int], font_size: int = 20):
+        self.window_pos = window_pos
+        # Must be set in ctor because must be called after pygame init
+        self.font = get_font(font_size)
+        self.lines: list[str] = []
+        self._surfaces: list[pygame.Surface] = []
+        self._drawn: list[str] | None = None
+
+    def set_lines(self, lines: list[str]):
+        if lines != self.lines:
+            self.lines = lines
+            self._surfaces = [self.font.render(line, True, self.text_color) for line in lines]
+
+    def is_dirty(self) -> bool:
+        return self._drawn != self.lines
+
+    def get_rect(self) -> pygame.Rect:
+        width = max((surface.get_width() for surface in self._surfaces), default=0)
+        return pygame.Rect(*self.window_pos, width + 10, len(self._surfaces) * self.font.get_linesize() + 10)
+
+    def draw(self, screen: pygame.Surface):
+        self._drawn = self.lines
+        screen.fill(self.bg_color, self.get_rect())
+        x, y = self.window_pos[0] + 5, self.window_pos[1] + 5
+        for surface in self._surfaces:
+            screen.blit(surface, (x, y))
+            y += self.font.get_linesize()
@@ -0,0 +1,86 @@
+import pygame
+from frame_profiler import profiler
+
+
+class DirtyRenderer:
+    """
+    Retained-mode drawing for a window. Every frame the window adds its components as layers (bottom first)
+    together with their screen rect and whether they changed. Only the changed areas are cleared, redrawn
+    and updated on the display.
+    """
+
+    def __init__(self, screen: pygame.Surface, bg_color: tuple[int, int, int]):
+        self.screen = screen
+        self.bg_color = bg_color
+        self.layers: list[tuple[str, pygame.Rect, bool, object]] = []
+        # Rects of the layers drawn in the previous frame, to clear components that moved or disappeared
+        self.previous_rects: dict[str, pygame.Rect] = {}
+        self.full_redraw = True
+
+    def invalidate(self):
+        """
+        Redraw the whole screen on the next flush
+        """
+        self.full_redraw = True
+
+    def add(self, key: str, rect: pygame.Rect, dirty: bool, draw):
+        """
+        Add a layer for this frame. key must be unique and stable between frames, draw() draws the component.
+        """
+        self.layers.append((key, rect, dirty, draw))
+
+    def _dirty_rects(self) -> list[pygame.Rect]:
+        if self.full_redraw:
+            return [self.screen.get_rect()]
+
+        rects = []
+        current_keys = set()
+        for key, rect, dirty, _ in self.layers:
+            current_keys.add(key)
+            old = self.previous_rects.get(key)
+            if dirty or old != rect:
+                rects.append(rect)
+            if old is not None and old != rect:
+                rects.append(old)
+        for key, old in self.previous_rects.items():
+            if key not in current_keys:
+                rects.append(old)
+
+        # Merge overlapping rects so no area is drawn twice
+        merged: list[pygame.Rect] = []
+        for rect in rects:
+            rect = rect.clip(self.screen.get_rect())
+            if rect.width == 0 or rect.height == 0:
+                continue
+            overlapping = rect.collidelist(merged)
+            while overlapping != -1:
+                rect = rect.union(merged.pop(overlapping))
+                overlapping = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    def flush(self) -> list[pygame.Rect]:
+        """
+        Draw the layers that touch a changed area and update those areas on the display.
+        Returns the updated rects.
+        """
+        rects = self._dirty_rects()
+        for area in rects:
+            self.screen.set_clip(area)
+            with profiler.section("clear"):
+                self.screen.fill(self.bg_color, area)
+            for key, rect, _, draw in self.layers:
+                if rect.colliderect(area):
+                    # per layer timing when profiling, see frame_profiler
+                    with profiler.section(key):
+                        draw()
+        self.screen.set_clip(None)
+
+        if rects:
+            with profiler.section("display.update"):
+                pygame.display.update(rects)
+
+        self.previous_rects = {key: rect for key, rect, _, _ in self.layers}
+        self.layers = []
+        self.full_redraw = False
+        return rects
@@ -67,9 +67,26 @@ class RoomGUI:
         self.room_name = room_name
         self.window_pos = window_pos
         self.people_inside = []
+        # CharacterGUI of everyone that has been in this room, reused when they come back
+        self._character_guis: dict[str, CharacterGUI] = {}
         self.label = TextArea(window_pos, self.size, room_name)
+        self._drawn_state = None
+
+    def _state(self, highlight: bool):
+        # Everything that changes how the room looks
+        return highlight, tuple((person.get_name(), person.character.is_alive()) for person in self.people_inside)
+
+    def get_rect(self) -> pygame.Rect:
+        return pygame.Rect(*self.window_pos, *self.size).union(self.label.get_rect())
+
+    def is_dirty(self, highlight: bool) -> bool:
+        """
+        True if highlight, occupancy or someone's alive state changed since the last draw
+        """
+        return self._state(highlight) != self._drawn_state or self.label.is_dirty()
 
     def draw(self, screen: pygame.Surface, highlight: bool):
+        self._drawn_state = self._state(highlight)
         room_box = pygame.Rect(self.window_pos[0], self.window_pos[1], self.size[0], self.size[1])
         pygame.draw.rect(screen, self.color, room_box)
         if highlight:
@@ -98,12 +115,19 @@ class RoomGUI:
     
     def update(self, people_inside: list[Character]):
         """
-        Update people in this room. CharacterGUI wrappers are made from them. People inside is set to empty list
-        if SHOW_ALL_CHARACTERS=False and player is not in the room
+        Update people in this room. CharacterGUI wrappers are made from them (once per character). People inside
+        is set to empty list if SHOW_ALL_CHARACTERS=False and player is not in the room
         """
         is_player_inside = len([c for c in people_inside if c.get_name() == PLAYER_NAME]) > 0
         if SHOW_ALL_CHARACTERS or is_player_inside:
-            self.people_inside = [CharacterGUI(c, self.window_pos, self.size) for c in people_inside]
+            self.people_inside = [self._character_gui(c) for c in people_inside]
+
+    def _character_gui(self, character: Character) -> CharacterGUI:
+        gui = self._character_guis.get(character.get_name())
+        if gui is None or gui.character is not character:
+            gui = CharacterGUI(character, self.window_pos, self.size)
+            self._character_guis[character.get_name()] = gui
+        return gui
 
     def is_inside_bounds(self, position: tuple[int, int]) -> bool:
         return ((self.window_pos[0] < position[0] < self.window_pos[0] + self.size[0])
@@ -10,9 +10,12 @@ REMAIN_AFTER_FINISH = 3
 class SpeechBubble:
     bg_color: tuple[int, int, int] = (140, 140, 160)
 
-    def __init__(self, character_name: str, text: str):
+    def __init__(self, character_name: str, text: str, streaming: bool = False):
         self.character_name = character_name
         self.text_to_write = list(text)
+        # While streaming, more text can still arrive with append_text
+        self.streaming = streaming
+        self.full_text = text
         self.window_pos = (300, 150)
         self.size = (680,400)
         self.text_pos = (self.window_pos[0], self.window_pos[1] + 50)
@@ -22,7 +25,15 @@ class SpeechBubble:
         self.last_revealed = time.time()
         self.done = False
         self.all_written = False
-        print(f"{character_name}: {text}") # debug printing
+        if not streaming:
+            print(f"{character_name}: {text}") # debug printing
+
+    def get_rect(self) -> pygame.Rect:
+        rect = pygame.Rect(*self.window_pos, *self.size)
+        return rect.union(self.name_text.get_rect()).union(self.text_area.get_rect())
+
+    def is_dirty(self) -> bool:
+        return self.name_text.is_dirty() or self.text_area.is_dirty()
 
     def draw(self, screen: pygame.Surface):
         rect = pygame.Rect(*self.window_pos, *self.size)
@@ -35,11 +46,19 @@ class SpeechBubble:
             if self.all_written:
                 self.done = True
 
+    def append_text(self, text: str):
+        self.text_to_write.extend(text)
+        self.full_text += text
+
+    def end_stream(self):
+        self.streaming = False
+        print(f"{self.character_name}: {self.full_text}") # debug printing
+
     def reveal_letter(self, now: float):
         if len(self.text_to_write) > 0:
             self.text_area.text += self.text_to_write.pop(0)
             self.last_revealed = now
-        else:
+        elif not self.streaming:
             self.all_written = True
 
     def update(self) -> bool:
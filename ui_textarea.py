@@ -1,55 +1,129 @@
+import re
 import pygame
 
+WORD_PATTERN = re.compile(r"\S+")
+
+_fonts: dict[int, pygame.font.Font] = {}
+
+def get_font(size: int) -> pygame.font.Font:
+    """
+    Fonts are shared between text areas, loading one is slow. Must be called after pygame init.
+    """
+    if size not in _fonts:
+        _fonts[size] = pygame.font.Font(None, size)
+    return _fonts[size]
+
+
 class TextArea:
     """
-    Any text display, with word wrapping
+    Any text display, with word wrapping.
+    The wrapped lines and their rendered surfaces are cached and only updated when the text or size changes.
     """
     text_color: tuple[int, int, int] = (0, 0, 0)
 
     def __init__(self, window_pos: tuple[int, int], size: tuple[int, int], text: str):
         self.window_pos = window_pos
         self.size = size
-        self.text = text
         # Must be set in ctor because must be called after pygame init
-        self.font: pygame.font.Font = pygame.font.Font(None, 32)
+        self.font: pygame.font.Font = get_font(32)
+
+        self.text = text
+        # Layout cache: lines, their surfaces, where the last line starts in the text
+        # and the text and size the layout was made for
+        self._lines: list[str] = []
+        self._surfaces: list[pygame.Surface] = []
+        self._last_line_start = 0
+        self._layout_text: str | None = None
+        self._layout_size: tuple[int, int] | None = None
+        # (text, size) of the last draw, used for dirty tracking
+        self._drawn: tuple[str, tuple[int, int]] | None = None
 
     def set_text(self, new_text: str):
         self.text = new_text
 
-    def draw(self, screen: pygame.Surface):
+    def _wrap(self, start: int) -> tuple[list[str], int]:
         """
-        Draw the rectangle and the wrapped text inside it.
+        Wrap the text beginning at index start, which must be the start of a line.
+        Returns the lines and the index where the last of them starts.
         """
-        # Wrap text to fit width
-        words = self.text.split(None)
         lines = []
         current_line = ""
+        current_start = start
 
-        for word in words:
+        for i, match in enumerate(WORD_PATTERN.finditer(self.text, start)):
+            word = match.group()
             test_line = current_line + word + " "
-            width, _ = self.font.size(test_line)
-
-            if width < self.size[0] - 10:
+            # When continuing from the middle of the text the first word is known to start the line
+            if (i == 0 and start > 0) or self.font.size(test_line)[0] < self.size[0] - 10:
                 current_line = test_line
             else:
                 lines.append(current_line)
                 current_line = word + " "
+                current_start = match.start()
         lines.append(current_line)
+        return lines, current_start
+
+    def _update_layout(self):
+        if self._layout_text == self.text and self._layout_size == self.size:
+            return
+
+        if (self._layout_size == self.size and self._layout_text is not None and self._last_line_start > 0
+                and self.text.startswith(self._layout_text)):
+            # Text was only appended to (speech bubble reveal, typing), earlier lines cannot change
+            tail, self._last_line_start = self._wrap(self._last_line_start)
+            lines = self._lines[:-1] + tail
+        else:
+            lines, self._last_line_start = self._wrap(0)
+
+        # Only render lines that changed
+        surfaces = []
+        for i, line in enumerate(lines):
+            if i < len(self._lines) and self._lines[i] == line:
+                surfaces.append(self._surfaces[i])
+            else:
+                surfaces.append(self.font.render(line, True, self.text_color))
+
+        self._lines = lines
+        self._surfaces = surfaces
+        self._layout_text = self.text
+        self._layout_size = self.size
+
+    def is_dirty(self) -> bool:
+        """
+        True if the text or size changed since the last draw
+        """
+        return self._drawn != (self.text, self.size)
+
+    def get_rect(self) -> pygame.Rect:
+        """
+        Screen area of the text area, grown to the wrapped text if it overflows
+        """
+        self._update_layout()
+        rect = pygame.Rect(*self.window_pos, *self.size)
+        text_width = max((surface.get_width() for surface in self._surfaces), default=0)
+        text_rect = pygame.Rect(self.window_pos[0], self.window_pos[1], text_width + 10, len(self._surfaces) * self.font.get_height() + 10)
+        return rect.union(text_rect)
+
+    def draw(self, screen: pygame.Surface):
+        """
+        Draw the rectangle and the wrapped text inside it.
+        """
+        self._update_layout()
+        self._drawn = (self.text, self.size)
 
         x = self.window_pos[0] + 5
         y = self.window_pos[1] + 5
 
         line_height = self.font.get_height()
 
-        for i, line in enumerate(lines):
+        for i, text_surface in enumerate(self._surfaces):
             # Uncomment to allow cutting off text that doesnt fit into designated area
             #if y + line_height > self.window_pos[1] + self.size[1] - 5:
             #    break
-            text_surface = self.font.render(line, True, self.text_color)
             screen.blit(text_surface, (x, y))
 
             # If this is the last visible line, update caret
-            if i == len(lines) - 1:
+            if i == len(self._surfaces) - 1:
                 text_width = text_surface.get_width()
                 self._caret_x = x + text_width
                 self._caret_y = y
@@ -61,4 +135,4 @@ class TextArea:
         Returns (caret_x, caret_y, font_height (= caret height)).
         Used by TextInput to draw the blinking caret.
         """
-        return self._caret_x, self._caret_y, self.font.get_height()
\ No newline at end of file
+        return self._caret_x, self._caret_y, self.font.get_height()
@@ -21,12 +21,38 @@ class TextInput:
         self._caret_visible = True
         self.text_area = TextArea(window_pos, size, "")
         self.on_enter_function = on_enter_function
+        self._drawn_state = None
+
+    def _state(self, mouse_pos: tuple[int, int]):
+        # Everything that changes how the input looks, except the text
+        rect = pygame.Rect(*self.window_pos, *self.size)
+        highlighted = self.focused or rect.collidepoint(mouse_pos)
+        return highlighted, self.focused and self._caret_visible
+
+    def _update_caret(self):
+        now = time.time()
+        if now - self._last_caret_switch > 0.5:
+            self._caret_visible = not self._caret_visible
+            self._last_caret_switch = now
+
+    def get_rect(self) -> pygame.Rect:
+        # caret is 2px wide and can be just right of the text
+        return pygame.Rect(*self.window_pos, *self.size).union(self.text_area.get_rect().inflate(4, 0))
+
+    def is_dirty(self, mouse_pos: tuple[int, int]) -> bool:
+        """
+        True if focus, hover, caret blink or text changed since the last draw
+        """
+        if self.focused:
+            self._update_caret()
+        return self._state(mouse_pos) != self._drawn_state or self.text_area.is_dirty()
 
     def draw(self, screen: pygame.Surface, mouse_pos: tuple[int, int]):
         """
         Draw the input box, its border, the text, and caret when focused.
         """
         rect = pygame.Rect(*self.window_pos, *self.size)
+        self._drawn_state = self._state(mouse_pos)
 
         # Draw background
         pygame.draw.rect(screen, self.bg_color, rect)
@@ -42,11 +68,6 @@ class TextInput:
 
         # Draw blinking caret
         if self.focused:
-            now = time.time()
-            if now - self._last_caret_switch > 0.5:
-                self._caret_visible = not self._caret_visible
-                self._last_caret_switch = now
-
             caret_pos = self.text_area.get_caret_position()
             if self._caret_visible:
                 pygame.draw.line(screen, self.text_color, 